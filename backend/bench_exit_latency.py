@@ -0,0 +1,113 @@
+"""
+journey_end latency benchmark for the Railway POC backend
+Times sync and async journey_end with rail_poc.db idle and while writer
+processes keep its write lock busy (as a violation burst or a busy settlement
+worker would). Async exits only write the settlement queue database, so their
+latency should not move with the load.
+Runs against throwaway SQLite files; no server needed.
+
+    python bench_exit_latency.py --users 300 --writers 2 --hold-ms 20
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_exits(main, Response, user_ids, settle):
+    """Time journey_end for users with an active journey (ms); counts failures"""
+    samples = []
+    failed = 0
+    for user_id in user_ids:
+        started = time.perf_counter()
+        try:
+            main.journey_end(user_id=user_id, response=Response(), settle=settle)
+        except Exception:
+            failed += 1
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, failed
+
+
+def write_load(path, stop, hold_ms):
+    """Hold rail_poc.db's write lock for hold_ms at a time until stop is set"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT INTO fare_logs (user_id, journey_id, amount, description) "
+            "VALUES ('LOAD', 'LOAD', 0, 'bench write load')")
+        time.sleep(hold_ms / 1000)
+        conn.execute("COMMIT")
+        time.sleep(0.001)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--writers", type=int, default=2,
+                        help="processes writing to rail_poc.db during the loaded runs")
+    parser.add_argument("--hold-ms", type=float, default=20,
+                        help="how long each writer transaction holds the lock")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # main.py creates its databases in the working directory on import
+        os.chdir(tmp)
+        sys.path.insert(0, BACKEND_DIR)
+        import main as backend
+        from fastapi import Response
+
+        # Riders are set up while rail_poc.db is idle; only the exits are timed
+        riders = {}
+        for load in ("idle", "loaded"):
+            for settle in ("sync", "async"):
+                user_ids = [backend.register_user()["user_id"] for _ in range(args.users)]
+                for user_id in user_ids:
+                    backend.journey_start(user_id=user_id, coach_id="C1")
+                riders[(settle, load)] = user_ids
+
+        for load in ("idle", "loaded"):
+            stop = multiprocessing.Event()
+            writers = [multiprocessing.Process(
+                target=write_load, args=(os.path.join(tmp, "rail_poc.db"), stop, args.hold_ms))
+                for _ in range(args.writers if load == "loaded" else 0)]
+            for writer in writers:
+                writer.start()
+            try:
+                for settle in ("sync", "async"):
+                    results[(settle, load)] = time_exits(
+                        backend, Response, riders[(settle, load)], settle)
+            finally:
+                stop.set()
+                for writer in writers:
+                    writer.join()
+
+        backend.engine.dispose()
+        backend.settlement_engine.dispose()
+        os.chdir(BACKEND_DIR)
+
+    print(f"\n⏱️  {args.users} exits per run, {args.writers} writer process(es) "
+          f"holding the lock {args.hold_ms:g} ms at a time when loaded (ms/request)\n")
+    print(f"   {'settle':<8}{'load':<8}{'p50':>8}{'p99':>8}{'max':>8}{'failed':>8}")
+    for (settle, load), (samples, failed) in results.items():
+        print(f"   {settle:<8}{load:<8}{percentile(samples, 50):>8.2f}"
+              f"{percentile(samples, 99):>8.2f}{max(samples):>8.2f}{failed:>8}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Hot-endpoint benchmark for the Railway POC backend
+Calls journey_start, wallet_balance and journey_end through the ORM path and
+the Core fast path (FAST_PATH) and reports CPU time per request for each.
+Runs against a throwaway SQLite file; no server needed.
+
+    python bench_fastpath.py --users 500 --rounds 3
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_calls(calls):
+    """CPU and wall time per call, in microseconds"""
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    for call in calls:
+        call()
+    count = len(calls)
+    return ((time.process_time() - cpu_started) / count * 1e6,
+            (time.perf_counter() - wall_started) / count * 1e6)
+
+
+def run_round(main, Response, user_ids):
+    """One journey per user: start, balance poll, end"""
+    return {
+        "journey_start": time_calls([
+            lambda u=u: main.journey_start(user_id=u[:8], coach_id="C1")
+            for u in user_ids]),
+        "wallet_balance": time_calls([
+            lambda u=u: main.wallet_balance(user_id=u)
+            for u in user_ids]),
+        "journey_end": time_calls([
+            lambda u=u: main.journey_end(user_id=u[:8], response=Response(), settle="sync")
+            for u in user_ids]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="journeys per user; the best round is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # main.py creates rail_poc.db in the working directory on import
+        os.chdir(tmp)
+        sys.path.insert(0, BACKEND_DIR)
+        import main as backend
+        from fastapi import Response
+
+        users = {
+            mode: [backend.register_user()["user_id"] for _ in range(args.users)]
+            for mode in ("orm", "fast")
+        }
+
+        results = {}
+        for mode in ("orm", "fast"):
+            backend.FAST_PATH = mode == "fast"
+            run_round(backend, Response, users[mode][:20])  # warm caches
+            rounds = [run_round(backend, Response, users[mode]) for _ in range(args.rounds)]
+            results[mode] = {
+                endpoint: min((r[endpoint] for r in rounds), key=lambda t: t[0])
+                for endpoint in rounds[0]
+            }
+
+        backend.engine.dispose()
+        os.chdir(BACKEND_DIR)
+
+    print(f"\n⏱️  {args.users} users x {args.rounds} rounds, best round per endpoint (µs/request)\n")
+    print(f"   {'endpoint':<16}{'orm cpu':>10}{'fast cpu':>10}{'saved':>8}{'orm wall':>11}{'fast wall':>11}")
+    for endpoint in results["orm"]:
+        orm_cpu, orm_wall = results["orm"][endpoint]
+        fast_cpu, fast_wall = results["fast"][endpoint]
+        saved = (1 - fast_cpu / orm_cpu) * 100 if orm_cpu else 0.0
+        print(f"   {endpoint:<16}{orm_cpu:>10.0f}{fast_cpu:>10.0f}{saved:>7.0f}%"
+              f"{orm_wall:>11.0f}{fast_wall:>11.0f}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
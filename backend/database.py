@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -16,3 +16,28 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base class for SQLAlchemy models
 Base = declarative_base()
+
+
+# Async journey exits are queued in a file of their own, so recording one
+# never waits behind the writers of rail_poc.db (see settlement.py)
+SETTLEMENT_DATABASE_URL = "sqlite:///./rail_poc_settlements.db"
+
+settlement_engine = create_engine(
+    SETTLEMENT_DATABASE_URL,
+    connect_args={"check_same_thread": False}
+)
+
+
+@event.listens_for(settlement_engine, "connect")
+def _settlement_wal(dbapi_connection, connection_record):
+    # WAL lets the settlement worker read the queue while requests append to it
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+
+SettlementSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=settlement_engine)
+
+# Base class for the tables in the settlement queue database
+SettlementBase = declarative_base()
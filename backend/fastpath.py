@@ -0,0 +1,120 @@
+import datetime
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, insert, select
+
+from models import User, Journey
+from wallet import charge_journey
+import rollups
+
+# Statements are built once at import; SQLAlchemy's compiled cache then maps
+# each to its SQL string, so a request only binds parameters and reads tuples.
+
+_USER_EXACT = select(User.user_id).where(User.user_id == bindparam("user_id"))
+
+_USER_PREFIX = select(User.user_id).where(
+    User.user_id.like(bindparam("prefix"))).limit(1)
+
+_BALANCE = select(User.wallet_balance).where(User.user_id == bindparam("user_id"))
+
+_ACTIVE_JOURNEY = select(
+    Journey.journey_id, Journey.start_time, Journey.coach_id
+).where(
+    Journey.user_id == bindparam("user_id"),
+    Journey.status == "ACTIVE"
+).limit(1)
+
+_HAS_ACTIVE_JOURNEY = select(Journey.journey_id).where(
+    Journey.user_id == bindparam("user_id"),
+    Journey.status == "ACTIVE"
+).limit(1)
+
+_INSERT_JOURNEY = insert(Journey)
+
+
+def _resolve_user(conn, user_id):
+    """Full user_id for a full or 8-char short ID (same rules as main._find_user)"""
+    full_user_id = conn.execute(_USER_EXACT, {"user_id": user_id}).scalar()
+    if full_user_id is None:
+        full_user_id = conn.execute(_USER_PREFIX, {"prefix": f"{user_id}%"}).scalar()
+    if full_user_id is None:
+        raise HTTPException(
+            status_code=404, detail=f"User not found: {user_id}")
+    return full_user_id
+
+
+def start_journey(conn, user_id, coach_id=None):
+    """Core version of main._start_journey; conn must be in a transaction"""
+    full_user_id = _resolve_user(conn, user_id)
+
+    active = conn.execute(_ACTIVE_JOURNEY, {"user_id": full_user_id}).first()
+    if active:
+        return {
+            "message": "Journey already active",
+            "journey_id": active[0],
+            "start_time": active[1]
+        }
+
+    journey_id = str(uuid.uuid4())
+    start_time = datetime.datetime.utcnow()
+    conn.execute(_INSERT_JOURNEY, {
+        "journey_id": journey_id,
+        "user_id": full_user_id,
+        "coach_id": coach_id,
+        "status": "ACTIVE",
+        "start_time": start_time,
+    })
+    rollups.record_journey_start(conn, start_time, coach_id)
+
+    return {
+        "message": "Journey started",
+        "journey_id": journey_id,
+        "user_id": user_id,
+        "start_time": start_time
+    }
+
+
+def end_journey(conn, user_id, fare_amount):
+    """Core version of main._end_journey; conn must be in a transaction"""
+    full_user_id = _resolve_user(conn, user_id)
+
+    active = conn.execute(_ACTIVE_JOURNEY, {"user_id": full_user_id}).first()
+    if not active:
+        raise HTTPException(
+            status_code=404, detail="No active journey found")
+    journey_id, start_time, coach_id = active
+
+    end_time = datetime.datetime.utcnow()
+    remaining_balance = charge_journey(
+        conn, full_user_id, journey_id, fare_amount,
+        "Auto fare deduction on journey end", end_time)
+    if remaining_balance is None:
+        raise HTTPException(
+            status_code=404, detail="No active journey found")
+
+    rollups.record_journey_end(conn, end_time, coach_id, fare_amount)
+
+    return {
+        "message": "Journey ended, fare deducted",
+        "journey_id": journey_id,
+        "fare_amount": fare_amount,
+        "remaining_balance": remaining_balance,
+        "journey_duration": str(end_time - start_time)
+    }
+
+
+def wallet_balance(conn, user_id):
+    """Core version of the /wallet_balance lookup"""
+    balance = conn.execute(_BALANCE, {"user_id": user_id}).scalar()
+    if balance is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    journey_active = conn.execute(
+        _HAS_ACTIVE_JOURNEY, {"user_id": user_id}).first() is not None
+
+    return {
+        "user_id": user_id,
+        "wallet_balance": balance,
+        "journey_active": journey_active
+    }
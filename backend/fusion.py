@@ -0,0 +1,183 @@
+import heapq
+import threading
+import time
+
+
+class _Presence:
+    """What the fusion service knows about one user across all readers"""
+    __slots__ = ('user_id', 'coach_id', 'reader_id', 'rssi', 'best_at',
+                 'first_seen', 'last_seen', 'entered')
+
+    def __init__(self, user_id, now):
+        self.user_id = user_id
+        self.coach_id = None
+        self.reader_id = None
+        self.rssi = None
+        self.best_at = now
+        self.first_seen = now
+        self.last_seen = now
+        self.entered = False
+
+
+class SightingFusion:
+    """
+    Merges BLE sightings from many readers into one entry/exit decision per user.
+
+    Sightings of the same user inside `window` seconds are deduplicated and the
+    strongest reader in that window decides which coach the user is in. Entry is
+    emitted once the first window closes; exit is emitted once no reader has
+    seen the user for `exit_delay` seconds.
+
+    Readers apply the enter/leave RSSI thresholds and the enter dwell
+    themselves and only report riders their filter has inside, with the
+    smoothed RSSI, so fusion does no thresholding of its own: a reading here
+    already means "this reader considers the rider on board".
+
+    ingest() only touches in-memory state under a lock, so the HTTP path stays
+    cheap. Decisions are handed to on_entry/on_exit from a background thread.
+    """
+
+    def __init__(self, on_entry, on_exit, window=2.0, exit_delay=10.0,
+                 tick_interval=0.5):
+        self.on_entry = on_entry
+        self.on_exit = on_exit
+        self.window = window
+        self.exit_delay = exit_delay
+        self.tick_interval = tick_interval
+
+        self._users = {}
+        # (due_time, user_id, kind) - entries are rechecked lazily when popped
+        self._deadlines = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.sightings = 0
+        self.deduplicated = 0
+        self.entries = 0
+        self.exits = 0
+        self.errors = 0
+
+    def ingest(self, reader_id, coach_id, sightings, now=None):
+        """
+        Record one batch of sightings from a reader.
+
+        Args:
+            sightings: iterable of (user_id, rssi) pairs
+        Returns:
+            number of sightings accepted
+        """
+        now = time.time() if now is None else now
+        accepted = 0
+
+        with self._lock:
+            users = self._users
+            for user_id, rssi in sightings:
+                accepted += 1
+                presence = users.get(user_id)
+
+                if presence is None:
+                    presence = users[user_id] = _Presence(user_id, now)
+                    heapq.heappush(self._deadlines,
+                                   (now + self.window, user_id, 'entry'))
+                    heapq.heappush(self._deadlines,
+                                   (now + self.exit_delay, user_id, 'exit'))
+                else:
+                    self.deduplicated += 1
+
+                # Strongest reader within the current window wins
+                if (presence.rssi is None or rssi > presence.rssi
+                        or now - presence.best_at > self.window):
+                    presence.coach_id = coach_id
+                    presence.reader_id = reader_id
+                    presence.rssi = rssi
+                    presence.best_at = now
+
+                presence.last_seen = now
+
+            self.sightings += accepted
+
+        return accepted
+
+    def tick(self, now=None):
+        """
+        Emit every decision that has come due.
+
+        Returns:
+            (entries, exits) as lists of (user_id, coach_id, reader_id)
+        """
+        now = time.time() if now is None else now
+        entries = []
+        exits = []
+
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] <= now:
+                _, user_id, kind = heapq.heappop(deadlines)
+                presence = self._users.get(user_id)
+                if presence is None:
+                    continue
+
+                if kind == 'entry':
+                    if not presence.entered:
+                        presence.entered = True
+                        entries.append((user_id, presence.coach_id, presence.reader_id))
+                    continue
+
+                # Seen again since this deadline was set - push it out
+                due = presence.last_seen + self.exit_delay
+                if due > now:
+                    heapq.heappush(deadlines, (due, user_id, 'exit'))
+                    continue
+
+                del self._users[user_id]
+                if presence.entered:
+                    exits.append((user_id, presence.coach_id, presence.reader_id))
+
+        # Decisions hit the database outside the lock so ingest never waits on it
+        for user_id, coach_id, reader_id in entries:
+            self._emit(self.on_entry, user_id, coach_id, reader_id)
+        for user_id, coach_id, reader_id in exits:
+            self._emit(self.on_exit, user_id, coach_id, reader_id)
+
+        self.entries += len(entries)
+        self.exits += len(exits)
+        return entries, exits
+
+    def _emit(self, callback, user_id, coach_id, reader_id):
+        try:
+            callback(user_id, coach_id, reader_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"Fusion decision failed for {user_id[:8]}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.tick_interval):
+            self.tick()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="sighting-fusion", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._users)
+            inside = sum(1 for p in self._users.values() if p.entered)
+        return {
+            "tracked_users": tracked,
+            "users_inside": inside,
+            "sightings": self.sightings,
+            "deduplicated": self.deduplicated,
+            "entries": self.entries,
+            "exits": self.exits,
+            "errors": self.errors,
+        }
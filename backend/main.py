@@ -1,12 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from sqlalchemy import func, insert, or_
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, SessionLocal, Base
-from models import User, Journey, FareLog
+from database import (engine, SessionLocal, Base,
+                      settlement_engine, SettlementSessionLocal, SettlementBase)
+from models import User, Journey, FareLog, Violation, Settlement
+from schemas import SightingBatch, ActiveJourneyQuery, ViolationBatch
+from fusion import SightingFusion
+from profiling import RequestProfiler, ProfilingMiddleware, ProfiledRoute
+from violations import ViolationIngest, QueueFull
+from settlement import SettlementWorker
+from wallet import adjust_balance, charge_journey
+import rollups
+import fastpath
+from typing import Optional
 import uuid
 import datetime
 
 # Create all database tables on startup
 Base.metadata.create_all(bind=engine)
+SettlementBase.metadata.create_all(bind=settlement_engine)
 
 app = FastAPI(title="Railway POC Backend")
 
@@ -19,6 +31,178 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in request profiling: send "X-Profile: 1" or open a window via /admin/profiling
+profiler = RequestProfiler()
+profiler.instrument(engine)
+profiler.instrument(settlement_engine)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+app.router.route_class = ProfiledRoute
+
+
+# Fare charged per journey; balances below this are flagged to readers
+FARE_AMOUNT = 20.0
+
+# Delta syncs re-send this much history to cover commits that landed late
+DELTA_OVERLAP = datetime.timedelta(seconds=5)
+
+# Serve journey_start, journey_end and wallet_balance with precompiled Core
+# statements (fastpath.py) instead of loading ORM objects
+FAST_PATH = True
+
+# Default for journey_end: "sync" settles the fare before replying, "async"
+# records the exit and leaves settlement to the background worker
+SETTLEMENT_MODE = "sync"
+
+# Fine charged to every rider in a coach when one of its doors reports a violation
+VIOLATION_FINE = 50.0
+
+# A door burst is one incident: riders are fined at most once per coach per window
+VIOLATION_COOLDOWN = datetime.timedelta(seconds=60)
+
+# Widest range a single /stats query may ask for
+STATS_MAX_HOURS = 24 * 31
+STATS_MAX_DAYS = 366
+
+# How long a sensor should wait before resending when the violation queue is full
+VIOLATION_RETRY_AFTER = 2
+
+# Violations the worker could not write even one at a time (JSON lines)
+VIOLATION_DEAD_LETTER_FILE = "violations_dead_letter.jsonl"
+
+
+def _fused_entry(user_id, coach_id, reader_id):
+    """Fusion decided user_id boarded coach_id"""
+    db = SessionLocal()
+    try:
+        _start_journey(db, user_id, coach_id)
+    finally:
+        db.close()
+
+
+def _fused_exit(user_id, coach_id, reader_id):
+    """Fusion decided user_id is no longer seen by any reader"""
+    db = SessionLocal()
+    try:
+        _end_journey(db, user_id)
+    finally:
+        db.close()
+
+
+# Merges sightings from every reader into one entry/exit per user
+fusion = SightingFusion(on_entry=_fused_entry, on_exit=_fused_exit)
+
+# coach_id -> occurred_at of the last violation that fined its riders
+_coach_fined_at = {}
+
+
+def _write_violations(events):
+    """
+    Record a batch of violation events and fine riders, in one transaction.
+    Runs on the violation worker thread, never on a request.
+    """
+    parsed = []
+    for coach_id, door_id, occurred_at in events:
+        try:
+            occurred = datetime.datetime.utcfromtimestamp(occurred_at)
+        except (OverflowError, OSError, ValueError, TypeError):
+            print(f"Skipping violation with bad occurred_at {occurred_at!r} "
+                  f"(coach {coach_id}, door {door_id})")
+            continue
+        parsed.append((coach_id, door_id, occurred))
+    if not parsed:
+        return
+
+    db = SessionLocal()
+    try:
+        # Riders are whoever was on board when the door went off - including
+        # journeys that have ended since - not whoever is on board now
+        coaches = {coach_id for coach_id, _, _ in parsed}
+        earliest = min(occurred for _, _, occurred in parsed)
+        latest = max(occurred for _, _, occurred in parsed)
+        journeys = {}
+        for user_id, journey_id, coach_id, start_time, end_time in db.query(
+                Journey.user_id, Journey.journey_id, Journey.coach_id,
+                Journey.start_time, Journey.end_time).filter(
+                Journey.coach_id.in_(coaches),
+                Journey.start_time <= latest,
+                or_(Journey.end_time.is_(None), Journey.end_time > earliest)):
+            journeys.setdefault(coach_id, []).append(
+                (user_id, journey_id, start_time, end_time))
+
+        fines = []
+        rows = []
+        # Cooldowns only take effect once this transaction has committed
+        fined_now = {}
+        for coach_id, door_id, occurred in parsed:
+            fined = []
+            last = fined_now.get(coach_id) or _coach_fined_at.get(coach_id)
+            # abs(): sensors may deliver an older event after a newer one
+            if last is None or abs(occurred - last) >= VIOLATION_COOLDOWN:
+                fined = [(user_id, journey_id)
+                         for user_id, journey_id, start_time, end_time
+                         in journeys.get(coach_id, [])
+                         if start_time <= occurred
+                         and (end_time is None or end_time > occurred)]
+                if fined:
+                    fined_now[coach_id] = occurred if last is None else max(last, occurred)
+                    fines.extend((user_id, journey_id, coach_id, door_id)
+                                 for user_id, journey_id in fined)
+            rows.append({
+                "coach_id": coach_id,
+                "door_id": door_id,
+                "occurred_at": occurred,
+                "fined_users": len(fined),
+            })
+
+        db.execute(insert(Violation), rows)
+
+        fined_at = datetime.datetime.utcnow()
+        for user_id, journey_id, coach_id, door_id in fines:
+            if adjust_balance(db, user_id, -VIOLATION_FINE) is not None:
+                rollups.record_fine(db, fined_at, VIOLATION_FINE)
+                db.add(FareLog(
+                    user_id=user_id,
+                    journey_id=journey_id,
+                    amount=VIOLATION_FINE,
+                    description=f"Safety violation fine (coach {coach_id}, door {door_id})"
+                ))
+
+        db.commit()
+        _coach_fined_at.update(fined_now)
+    finally:
+        db.close()
+
+
+# Buffers door-sensor violations and writes them off the request path
+violations = ViolationIngest(on_batch=_write_violations,
+                             dead_letter_path=VIOLATION_DEAD_LETTER_FILE)
+
+
+@app.on_event("startup")
+def rebuild_rollups_if_missing():
+    """One-off backfill for a database created before the rollup tables"""
+    db = SessionLocal()
+    try:
+        if rollups.needs_rebuild(db):
+            print("Rebuilding stats rollups from journey history...")
+            rollups.rebuild(db)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def start_background_workers():
+    fusion.start()
+    violations.start()
+    settlement_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    fusion.stop()
+    violations.stop()
+    settlement_worker.stop()
+
 
 @app.get("/")
 def root():
@@ -47,122 +231,283 @@ def register_user():
         db.close()
 
 
-@app.post("/journey_start")
-def journey_start(user_id: str):
+def _find_user(db, user_id):
     """
-    Start a new journey when Raspberry Pi detects BLE proximity.
-    Creates ACTIVE journey record.
-    Supports partial user_id matching (first 8 chars from BLE).
+    Look up a user by full user_id, falling back to a prefix match
+    because BLE only carries the first 8 chars.
     """
-    db = SessionLocal()
-    try:
-        # First try exact match
-        user = db.query(User).filter(User.user_id == user_id).first()
+    # First try exact match
+    user = db.query(User).filter(User.user_id == user_id).first()
 
-        # If not found, try partial match (BLE sends truncated ID)
-        if not user:
-            user = db.query(User).filter(
-                User.user_id.like(f"{user_id}%")).first()
+    # If not found, try partial match (BLE sends truncated ID)
+    if not user:
+        user = db.query(User).filter(
+            User.user_id.like(f"{user_id}%")).first()
 
-        if not user:
-            raise HTTPException(
-                status_code=404, detail=f"User not found: {user_id}")
+    if not user:
+        raise HTTPException(
+            status_code=404, detail=f"User not found: {user_id}")
 
-        # Use the full user_id from database
-        full_user_id = user.user_id
+    return user
 
-        # Check if user already has an active journey
-        active_journey = db.query(Journey).filter(
-            Journey.user_id == full_user_id,
-            Journey.status == "ACTIVE"
-        ).first()
 
-        if active_journey:
-            return {
-                "message": "Journey already active",
-                "journey_id": active_journey.journey_id,
-                "start_time": active_journey.start_time
-            }
-
-        # Create new journey
-        journey_id = str(uuid.uuid4())
-        new_journey = Journey(
-            journey_id=journey_id,
-            user_id=full_user_id,
-            status="ACTIVE"
-        )
-        db.add(new_journey)
-        db.commit()
+def _start_journey(db, user_id, coach_id=None):
+    """Create an ACTIVE journey for user_id unless one is already running"""
+    user = _find_user(db, user_id)
+
+    # Use the full user_id from database
+    full_user_id = user.user_id
+
+    # Check if user already has an active journey
+    active_journey = db.query(Journey).filter(
+        Journey.user_id == full_user_id,
+        Journey.status == "ACTIVE"
+    ).first()
 
+    if active_journey:
         return {
-            "message": "Journey started",
-            "journey_id": journey_id,
-            "user_id": user_id,
-            "start_time": new_journey.start_time
+            "message": "Journey already active",
+            "journey_id": active_journey.journey_id,
+            "start_time": active_journey.start_time
         }
-    finally:
-        db.close()
 
+    # Create new journey
+    journey_id = str(uuid.uuid4())
+    start_time = datetime.datetime.utcnow()
+    new_journey = Journey(
+        journey_id=journey_id,
+        user_id=full_user_id,
+        coach_id=coach_id,
+        status="ACTIVE",
+        start_time=start_time
+    )
+    db.add(new_journey)
+    rollups.record_journey_start(db, start_time, coach_id)
+    db.commit()
+
+    return {
+        "message": "Journey started",
+        "journey_id": journey_id,
+        "user_id": user_id,
+        "start_time": new_journey.start_time
+    }
+
+
+def _close_journey(db, user_id):
+    """
+    End the ACTIVE journey for user_id and deduct the fare, without committing.
+    Raises HTTPException before touching anything if there is nothing to end.
+    """
+    user = _find_user(db, user_id)
+
+    # Use the full user_id from database
+    full_user_id = user.user_id
 
-@app.post("/journey_end")
-def journey_end(user_id: str):
+    # Find active journey for this user
+    active_journey = db.query(
+        Journey.journey_id, Journey.start_time, Journey.coach_id
+    ).filter(
+        Journey.user_id == full_user_id,
+        Journey.status == "ACTIVE"
+    ).first()
+
+    if not active_journey:
+        raise HTTPException(
+            status_code=404, detail="No active journey found")
+
+    fare_amount = FARE_AMOUNT
+    end_time = datetime.datetime.utcnow()
+
+    # Flip the journey and deduct the fare as conditional UPDATEs - a
+    # concurrent journey_end for the same journey can't charge twice
+    # (allow negative balance for POC - in production would check minimum)
+    remaining_balance = charge_journey(
+        db, full_user_id, active_journey.journey_id, fare_amount,
+        "Auto fare deduction on journey end", end_time)
+
+    if remaining_balance is None:
+        raise HTTPException(
+            status_code=404, detail="No active journey found")
+
+    rollups.record_journey_end(db, end_time, active_journey.coach_id, fare_amount)
+
+    return {
+        "message": "Journey ended, fare deducted",
+        "journey_id": active_journey.journey_id,
+        "fare_amount": fare_amount,
+        "remaining_balance": remaining_balance,
+        "journey_duration": str(end_time - active_journey.start_time)
+    }
+
+
+def _end_journey(db, user_id):
+    """End the ACTIVE journey for user_id and deduct the fare"""
+    result = _close_journey(db, user_id)
+    db.commit()
+    return result
+
+
+def _settle_pending(limit):
     """
-    End journey when Raspberry Pi detects BLE exit (out of range).
-    Deducts ₹20 fare from wallet and logs transaction.
-    Supports partial user_id matching (first 8 chars from BLE).
+    Settle up to `limit` queued exits, oldest first, in one transaction.
+    Exits that cannot be settled (unknown user, no active journey) are
+    marked FAILED rather than retried.
+
+    The queue is a separate database, so the fares are committed first and
+    the queue rows second. If the process dies in between, those exits are
+    picked up again; their journeys are already ENDED, so they are marked
+    FAILED ("No active journey found") rather than charged twice.
     """
+    queue = SettlementSessionLocal()
     db = SessionLocal()
     try:
-        # First try exact match for user
-        user = db.query(User).filter(User.user_id == user_id).first()
+        pending = queue.query(Settlement).filter(
+            Settlement.status == "PENDING"
+        ).order_by(Settlement.requested_at).limit(limit).all()
+
+        for settlement in pending:
+            try:
+                result = _close_journey(db, settlement.user_id)
+            except HTTPException as e:
+                settlement.status = "FAILED"
+                settlement.error = e.detail
+            else:
+                settlement.status = "SETTLED"
+                settlement.journey_id = result["journey_id"]
+                settlement.fare_amount = result["fare_amount"]
+                settlement.remaining_balance = result["remaining_balance"]
+            settlement.settled_at = datetime.datetime.utcnow()
 
-        # If not found, try partial match (BLE sends truncated ID)
-        if not user:
-            user = db.query(User).filter(
-                User.user_id.like(f"{user_id}%")).first()
+        db.commit()
+        queue.commit()
+        return len(pending)
+    finally:
+        db.close()
+        queue.close()
 
-        if not user:
-            raise HTTPException(
-                status_code=404, detail=f"User not found: {user_id}")
 
-        # Use the full user_id from database
-        full_user_id = user.user_id
+# Prices and settles exits queued by journey_end in async mode
+settlement_worker = SettlementWorker(settle_batch=_settle_pending)
 
-        # Find active journey for this user
-        active_journey = db.query(Journey).filter(
-            Journey.user_id == full_user_id,
-            Journey.status == "ACTIVE"
-        ).first()
 
-        if not active_journey:
-            raise HTTPException(
-                status_code=404, detail="No active journey found")
+@app.post("/journey_start")
+def journey_start(user_id: str, coach_id: Optional[str] = None):
+    """
+    Start a new journey when Raspberry Pi detects BLE proximity.
+    Creates ACTIVE journey record.
+    Supports partial user_id matching (first 8 chars from BLE).
+    """
+    if FAST_PATH:
+        with engine.begin() as conn:
+            return fastpath.start_journey(conn, user_id, coach_id)
 
-        fare_amount = 20.0
+    db = SessionLocal()
+    try:
+        return _start_journey(db, user_id, coach_id)
+    finally:
+        db.close()
 
-        # Deduct fare (allow negative balance for POC - in production would check minimum)
-        user.wallet_balance -= fare_amount
 
-        # Mark journey as ended
-        active_journey.status = "ENDED"
-        active_journey.end_time = datetime.datetime.utcnow()
+@app.post("/journey_end")
+def journey_end(user_id: str, response: Response, settle: Optional[str] = None):
+    """
+    End journey when Raspberry Pi detects BLE exit (out of range).
+    Deducts ₹20 fare from wallet and logs transaction.
+    Supports partial user_id matching (first 8 chars from BLE).
 
-        # Log fare deduction
-        fare_log = FareLog(
-            user_id=full_user_id,
-            journey_id=active_journey.journey_id,
-            amount=fare_amount,
-            description="Auto fare deduction on journey end"
+    With settle=async (or SETTLEMENT_MODE = "async") the exit is only recorded
+    and 202 is returned straight away; the fare is settled in the background
+    and can be followed through /settlement_status.
+    """
+    settle = settle or SETTLEMENT_MODE
+    if settle not in ("sync", "async"):
+        raise HTTPException(status_code=400, detail="settle must be 'sync' or 'async'")
+
+    if settle == "sync" and FAST_PATH:
+        with engine.begin() as conn:
+            return fastpath.end_journey(conn, user_id, FARE_AMOUNT)
+
+    if settle == "sync":
+        db = SessionLocal()
+        try:
+            return _end_journey(db, user_id)
+        finally:
+            db.close()
+
+    # Only the settlement queue is written here - rail_poc.db is not touched
+    # until the worker settles the exit
+    db = SettlementSessionLocal()
+    try:
+        settlement = Settlement(
+            settlement_id=str(uuid.uuid4()),
+            user_id=user_id,
+            status="PENDING"
         )
-        db.add(fare_log)
+        db.add(settlement)
         db.commit()
+        settlement_worker.notify()
 
+        response.status_code = 202
         return {
-            "message": "Journey ended, fare deducted",
-            "journey_id": active_journey.journey_id,
-            "fare_amount": fare_amount,
-            "remaining_balance": user.wallet_balance,
-            "journey_duration": str(active_journey.end_time - active_journey.start_time)
+            "message": "Journey exit recorded, fare settlement pending",
+            "settlement_id": settlement.settlement_id,
+            "status": settlement.status,
+            "requested_at": settlement.requested_at
+        }
+    finally:
+        db.close()
+
+
+def _settlement_view(settlement):
+    return {
+        "settlement_id": settlement.settlement_id,
+        "user_id": settlement.user_id,
+        "status": settlement.status,
+        "requested_at": settlement.requested_at,
+        "settled_at": settlement.settled_at,
+        "journey_id": settlement.journey_id,
+        "fare_amount": settlement.fare_amount,
+        "remaining_balance": settlement.remaining_balance,
+        "error": settlement.error
+    }
+
+
+@app.get("/settlement_status")
+def settlement_status(settlement_id: Optional[str] = None, user_id: Optional[str] = None):
+    """
+    Follow asynchronous fare settlement.
+    settlement_id returns that exit; user_id returns the user's latest exits
+    (full or 8-char short ID); neither returns queue counters.
+    """
+    db = SettlementSessionLocal()
+    try:
+        if settlement_id:
+            settlement = db.query(Settlement).filter(
+                Settlement.settlement_id == settlement_id).first()
+            if not settlement:
+                raise HTTPException(status_code=404, detail="Settlement not found")
+            return _settlement_view(settlement)
+
+        if user_id:
+            settlements = db.query(Settlement).filter(
+                or_(
+                    Settlement.user_id == user_id,
+                    Settlement.user_id == user_id[:8]
+                )
+            ).order_by(Settlement.requested_at.desc()).limit(20).all()
+            return {"settlements": [_settlement_view(s) for s in settlements]}
+
+        counts = dict(db.query(Settlement.status, func.count()).group_by(
+            Settlement.status).all())
+        oldest_pending = db.query(func.min(Settlement.requested_at)).filter(
+            Settlement.status == "PENDING").scalar()
+        return {
+            "mode": SETTLEMENT_MODE,
+            "pending": counts.get("PENDING", 0),
+            "settled": counts.get("SETTLED", 0),
+            "failed": counts.get("FAILED", 0),
+            "oldest_pending": oldest_pending,
+            "worker": settlement_worker.stats()
         }
     finally:
         db.close()
@@ -174,6 +519,10 @@ def wallet_balance(user_id: str):
     Get current wallet balance for a user.
     Polled by Android app every 5 seconds.
     """
+    if FAST_PATH:
+        with engine.connect() as conn:
+            return fastpath.wallet_balance(conn, user_id)
+
     db = SessionLocal()
     try:
         user = db.query(User).filter(User.user_id == user_id).first()
@@ -203,13 +552,11 @@ def add_funds(user_id: str):
     """
     db = SessionLocal()
     try:
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # Add fixed ₹100
+        # Add fixed ₹100 in a single UPDATE (no read-modify-write)
         add_amount = 100.0
-        user.wallet_balance += add_amount
+        new_balance = adjust_balance(db, user_id, add_amount)
+        if new_balance is None:
+            raise HTTPException(status_code=404, detail="User not found")
 
         # Log transaction
         fare_log = FareLog(
@@ -219,12 +566,226 @@ def add_funds(user_id: str):
             description="Funds added by user"
         )
         db.add(fare_log)
+        rollups.record_top_up(db, datetime.datetime.utcnow(), add_amount)
         db.commit()
 
         return {
             "message": "Funds added successfully",
             "amount_added": add_amount,
-            "new_balance": user.wallet_balance
+            "new_balance": new_balance
+        }
+    finally:
+        db.close()
+
+
+@app.post("/journeys/active")
+def journeys_active(query: ActiveJourneyQuery):
+    """
+    Bulk check which of the given users have an ACTIVE journey.
+    Used by a restarting reader to reconcile its restored tracker in one call.
+    Accepts full user_ids or 8-char short IDs; answers keyed by the ID as sent.
+    """
+    requested = set(query.user_ids)
+    if not requested:
+        return {"active": {}}
+
+    db = SessionLocal()
+    try:
+        rows = db.query(Journey.user_id, Journey.journey_id).filter(
+            Journey.status == "ACTIVE",
+            or_(
+                Journey.user_id.in_(requested),
+                func.substr(Journey.user_id, 1, 8).in_(requested)
+            )
+        ).all()
+
+        active = {}
+        for full_user_id, journey_id in rows:
+            if full_user_id in requested:
+                active[full_user_id] = journey_id
+            if full_user_id[:8] in requested:
+                active[full_user_id[:8]] = journey_id
+
+        return {"active": active}
+    finally:
+        db.close()
+
+
+@app.get("/users/delta")
+def users_delta(since: Optional[float] = None):
+    """
+    Short IDs (first 8 chars, as sent over BLE) of users changed since `since`.
+    Readers keep a local directory of these so unknown IDs are dropped
+    without a backend round trip. Omit `since` for a full snapshot.
+    Pass the returned cursor back as `since` on the next call.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(User.user_id, User.wallet_balance, User.updated_at)
+        if since is not None:
+            try:
+                changed_after = datetime.datetime.utcfromtimestamp(since) - DELTA_OVERLAP
+            except (OverflowError, OSError, ValueError):
+                raise HTTPException(
+                    status_code=400, detail="since must be a unix timestamp")
+            query = query.filter(User.updated_at >= changed_after)
+
+        users = []
+        cursor = since or 0.0
+        for user_id, balance, updated_at in query:
+            users.append({
+                "short_id": user_id[:8],
+                "low_balance": balance < FARE_AMOUNT
+            })
+            if updated_at is not None:
+                stamp = updated_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+                cursor = max(cursor, stamp)
+
+        return {
+            "cursor": cursor,
+            "full": since is None,
+            "users": users
         }
     finally:
         db.close()
+
+
+@app.post("/sightings")
+def sightings(batch: SightingBatch):
+    """
+    Receive one scan's worth of sightings from a reader running in fusion mode.
+    Journeys are started/ended by the fusion service, not by the reader.
+    """
+    accepted = fusion.ingest(
+        batch.reader_id,
+        batch.coach_id,
+        ((s.user_id, s.rssi) for s in batch.sightings)
+    )
+    return {"accepted": accepted}
+
+
+@app.get("/fusion/status")
+def fusion_status():
+    """Counters for the multi-reader fusion service"""
+    return fusion.stats()
+
+
+def _queue_violations(events):
+    try:
+        return violations.offer(events)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=503, detail=str(e),
+            headers={"Retry-After": str(VIOLATION_RETRY_AFTER)})
+
+
+@app.post("/trigger_violation", status_code=202)
+def trigger_violation(coach_id: str, door_id: str):
+    """
+    Report a door-sensor safety violation.
+    Queued and written in bulk in the background; every rider whose journey
+    in the coach covers the violation time is fined (once per coach per
+    cooldown window), even if they have got off since.
+    Returns 503 with Retry-After when the queue is full.
+    """
+    queued = _queue_violations([(coach_id, door_id, None)])
+    return {"accepted": 1, "queued": queued, "fine": VIOLATION_FINE}
+
+
+@app.post("/violations", status_code=202)
+def report_violations(batch: ViolationBatch):
+    """Batched form of /trigger_violation for sensors that buffer events"""
+    queued = _queue_violations(
+        (event.coach_id, event.door_id, event.occurred_at) for event in batch.events)
+    return {"accepted": len(batch.events), "queued": queued, "fine": VIOLATION_FINE}
+
+
+@app.get("/violations/status")
+def violations_status():
+    """Queue depth and write counters for the violation pipeline"""
+    return violations.stats()
+
+
+def _naive_utc(moment):
+    """Rollups store naive UTC; convert a timezone-aware query parameter to match"""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+@app.get("/stats/journeys_per_hour")
+def stats_journeys_per_hour(start: Optional[datetime.datetime] = None,
+                            end: Optional[datetime.datetime] = None):
+    """
+    Journeys started/ended per UTC hour in [start, end), default the last 24h.
+    Reads only the hourly rollup, so cost depends on the range, not history.
+    Naive times are taken as UTC; times with an offset are converted to UTC.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    end = end or datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    start = start or end - datetime.timedelta(hours=25)
+    if start >= end or end - start > datetime.timedelta(hours=STATS_MAX_HOURS):
+        raise HTTPException(
+            status_code=400, detail=f"Range must be positive and at most {STATS_MAX_HOURS} hours")
+
+    db = SessionLocal()
+    try:
+        return {"start": start, "end": end,
+                "hours": rollups.journeys_per_hour(db, start, end)}
+    finally:
+        db.close()
+
+
+@app.get("/stats/revenue_per_day")
+def stats_revenue_per_day(start: Optional[datetime.date] = None,
+                          end: Optional[datetime.date] = None):
+    """Fares, fines and top-ups per UTC day in [start, end], default the last 30 days"""
+    end = end or datetime.datetime.utcnow().date()
+    start = start or end - datetime.timedelta(days=29)
+    if start > end or (end - start).days >= STATS_MAX_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"Range must be positive and at most {STATS_MAX_DAYS} days")
+
+    db = SessionLocal()
+    try:
+        return {"start": start, "end": end,
+                "days": rollups.revenue_per_day(db, start, end)}
+    finally:
+        db.close()
+
+
+@app.get("/stats/active_riders")
+def stats_active_riders():
+    """Riders currently on board per coach, from the coach rollup"""
+    db = SessionLocal()
+    try:
+        coaches = rollups.active_riders(db)
+        return {"total": sum(coach["active"] for coach in coaches),
+                "coaches": coaches}
+    finally:
+        db.close()
+
+
+@app.post("/admin/profiling")
+def set_profiling(enabled: bool = True, duration: float = 60.0):
+    """Profile every request for the next `duration` seconds (or stop early)"""
+    if enabled:
+        if duration <= 0 or duration > 3600:
+            raise HTTPException(status_code=400, detail="duration must be between 0 and 3600 seconds")
+        profiler.open_window(duration)
+    else:
+        profiler.close_window()
+    return profiling_status()
+
+
+@app.get("/admin/profiling")
+def profiling_status():
+    """Current profiling window and the stored profile artifacts"""
+    remaining = max(0.0, profiler.window_until - datetime.datetime.now().timestamp())
+    return {
+        "window_active": remaining > 0,
+        "window_remaining_s": round(remaining, 1),
+        "directory": profiler.directory,
+        "keep": profiler.keep,
+        "profiles": profiler.artifacts(),
+    }
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Float, DateTime, Integer
-from database import Base
+from sqlalchemy import Column, String, Float, DateTime, Date, Integer
+from database import Base, SettlementBase
 import datetime
 
 
@@ -10,6 +10,9 @@ class User(Base):
     user_id = Column(String, primary_key=True, index=True)
     wallet_balance = Column(Float, default=100.0)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Bumped on every change so readers can sync deltas (GET /users/delta)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow,
+                        onupdate=datetime.datetime.utcnow, index=True)
 
 
 class Journey(Base):
@@ -18,6 +21,7 @@ class Journey(Base):
 
     journey_id = Column(String, primary_key=True, index=True)
     user_id = Column(String, index=True)
+    coach_id = Column(String, nullable=True, index=True)
     status = Column(String, default="ACTIVE")  # ACTIVE or ENDED
     start_time = Column(DateTime, default=datetime.datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
@@ -33,3 +37,69 @@ class FareLog(Base):
     amount = Column(Float)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     description = Column(String)
+
+
+class Violation(Base):
+    """Violation table records door-sensor safety violations and the fines they caused"""
+    __tablename__ = "violations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    coach_id = Column(String, index=True)
+    door_id = Column(String)
+    occurred_at = Column(DateTime, index=True)
+    recorded_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Riders fined for this event (0 inside the coach's fine cooldown)
+    fined_users = Column(Integer, default=0)
+
+
+class Settlement(SettlementBase):
+    """
+    Settlement table queues journey exits for background fare settlement.
+    Lives in the settlement queue database, not rail_poc.db.
+    """
+    __tablename__ = "settlements"
+
+    settlement_id = Column(String, primary_key=True, index=True)
+    # As sent by the reader - may be the 8-char short ID
+    user_id = Column(String, index=True)
+    status = Column(String, default="PENDING", index=True)  # PENDING, SETTLED or FAILED
+    requested_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    settled_at = Column(DateTime, nullable=True)
+    journey_id = Column(String, nullable=True)
+    fare_amount = Column(Float, nullable=True)
+    remaining_balance = Column(Float, nullable=True)
+    error = Column(String, nullable=True)
+
+
+# Rollups - maintained by rollups.py in the same transaction as the change
+# they count, so /stats never has to scan journeys or fare_logs
+
+class JourneyHourly(Base):
+    """Journeys started and ended per UTC hour"""
+    __tablename__ = "rollup_journeys_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    started = Column(Integer, default=0, nullable=False)
+    ended = Column(Integer, default=0, nullable=False)
+
+
+class RevenueDaily(Base):
+    """Money in and out of wallets per UTC day"""
+    __tablename__ = "rollup_revenue_daily"
+
+    day = Column(Date, primary_key=True)
+    fares = Column(Float, default=0.0, nullable=False)
+    fare_count = Column(Integer, default=0, nullable=False)
+    fines = Column(Float, default=0.0, nullable=False)
+    fine_count = Column(Integer, default=0, nullable=False)
+    top_ups = Column(Float, default=0.0, nullable=False)
+    top_up_count = Column(Integer, default=0, nullable=False)
+
+
+class CoachRiders(Base):
+    """Riders currently on board (ACTIVE journeys) per coach"""
+    __tablename__ = "rollup_coach_riders"
+
+    coach_id = Column(String, primary_key=True)
+    active = Column(Integer, default=0, nullable=False)
+    boarded = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,300 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+# Where profile artifacts go, and how many requests' worth to keep
+PROFILE_DIR = os.environ.get("RAIL_PROFILE_DIR", "./profiles")
+PROFILE_KEEP = int(os.environ.get("RAIL_PROFILE_KEEP", "50"))
+
+# Stack sampling period (seconds)
+SAMPLE_INTERVAL = 0.002
+
+# Request header that turns profiling on for that request
+PROFILE_HEADER = b"x-profile"
+PROFILE_ON = (b"1", b"true", b"yes")
+
+_current = contextvars.ContextVar("profile_session", default=None)
+
+
+class ProfileSession:
+    """Samples and SQL timings collected for one profiled request"""
+
+    def __init__(self, method, path):
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.statements = []
+
+
+
+def _fold(frame):
+    """Collapse a stack into flamegraph 'root;...;leaf' form"""
+    names = []
+    while frame is not None and len(names) < 128:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class RequestProfiler:
+    """
+    Opt-in sampling profiler for backend requests.
+
+    A request is profiled when it carries an `X-Profile: 1` header or while a
+    profiling window opened through /admin/profiling is running. Sync
+    endpoints are wrapped (ProfiledRoute) so the threadpool thread running
+    one attaches itself for the whole call; a background thread samples the
+    stacks of attached threads and only runs while a profiled request is in
+    flight. SQL statements are timed through engine events. With profiling
+    off the cost is a window/header check in ProfilingMiddleware plus one
+    context-variable lookup per endpoint call and per SQL statement.
+
+    Each profiled request leaves two files in PROFILE_DIR: <id>.folded
+    (collapsed stacks for flamegraph.pl / speedscope) and <id>.json (request,
+    duration and every SQL statement with its timing). Only the newest
+    PROFILE_KEEP requests are kept.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP,
+                 interval=SAMPLE_INTERVAL):
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval
+        self.window_until = 0.0
+
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="profile-writer")
+
+    # --- SQL tagging -------------------------------------------------------
+
+    def instrument(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        session = _current.get()
+        if session is None:
+            return
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        session = _current.get()
+        if session is None:
+            return
+        started = conn.info["profile_started"].pop()
+        session.statements.append({
+            "sql": statement,
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+        })
+
+    # --- request lifecycle -------------------------------------------------
+
+    def wants(self, headers):
+        """headers: raw ASGI (name, value) byte pairs"""
+        if time.time() < self.window_until:
+            return True
+        for name, value in headers:
+            if name == PROFILE_HEADER:
+                return value.lower() in PROFILE_ON
+        return False
+
+    def begin(self, method, path):
+        session = ProfileSession(method, path)
+        token = _current.set(session)
+        with self._lock:
+            self._active.add(session)
+        self._ensure_sampler()
+        self._wake.set()
+        return session, token
+
+    def end(self, session, token, status_code):
+        _current.reset(token)
+        with self._lock:
+            self._active.discard(session)
+        duration = time.time() - session.started
+        # Artifacts are written on their own thread, never on the event loop
+        self._writer.submit(self._write_safely, session, status_code, duration)
+
+    def _write_safely(self, session, status_code, duration):
+        try:
+            self._write(session, status_code, duration)
+        except OSError as e:
+            print(f"Could not write profile {session.profile_id}: {e}")
+
+    def open_window(self, seconds):
+        self.window_until = time.time() + seconds
+
+    def close_window(self):
+        self.window_until = 0.0
+
+    # --- sampling ----------------------------------------------------------
+
+    def _ensure_sampler(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._sample_loop, name="request-profiler",
+                        daemon=True)
+                    self._thread.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                sessions = list(self._active)
+                if not sessions:
+                    self._wake.clear()
+            if not sessions:
+                self._wake.wait()
+                continue
+
+            frames = sys._current_frames()
+            for session in sessions:
+                for thread_id in list(session.threads):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        session.stacks[_fold(frame)] += 1
+                        session.samples += 1
+            del frames
+
+            time.sleep(self.interval)
+
+    # --- artifacts ---------------------------------------------------------
+
+    def _write(self, session, status_code, duration):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started))
+        base = os.path.join(self.directory, f"{stamp}_{session.profile_id}")
+
+        with open(f"{base}.folded", "w") as folded:
+            for stack, count in session.stacks.most_common():
+                folded.write(f"{stack} {count}\n")
+
+        with open(f"{base}.json", "w") as summary:
+            json.dump({
+                "profile_id": session.profile_id,
+                "method": session.method,
+                "path": session.path,
+                "status_code": status_code,
+                "started": session.started,
+                "duration_ms": round(duration * 1000, 3),
+                "samples": session.samples,
+                "sample_interval_ms": self.interval * 1000,
+                "sql_ms": round(sum(s["ms"] for s in session.statements), 3),
+                "statements": session.statements,
+            }, summary, indent=2)
+
+        self._rotate()
+
+    def _summaries(self):
+        """Profile summary files, oldest first"""
+        paths = [os.path.join(self.directory, name)
+                 for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted(paths, key=os.path.getmtime)
+
+    def _rotate(self):
+        summaries = self._summaries()
+        for path in summaries[:-self.keep] if self.keep else summaries:
+            base = path[:-len(".json")]
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def artifacts(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [os.path.basename(path)[:-len(".json")]
+                for path in reversed(self._summaries())]
+
+
+def _attach_thread(call):
+    """Wrap a sync endpoint so its threadpool thread is sampled while it runs"""
+    code = call.__code__
+    entry = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        session = _current.get()
+        if session is None:
+            return call(*args, **kwargs)
+        thread_id = threading.get_ident()
+        session.threads.add(thread_id)
+        # One sample at entry, so even a request faster than the sampling
+        # interval shows which endpoint it ran
+        session.stacks[f"{_fold(sys._getframe(1))};{entry}"] += 1
+        session.samples += 1
+        try:
+            return call(*args, **kwargs)
+        finally:
+            session.threads.discard(thread_id)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """
+    APIRoute whose sync endpoint attaches its worker thread to the request's
+    profile session. Set as app.router.route_class before declaring routes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The request handler reads dependant.call per request, after the
+        # signature has already been analysed, so swapping it here is safe
+        if not asyncio.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = _attach_thread(self.dependant.call)
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware: unprofiled requests pass straight through without
+    the per-request task and body streaming BaseHTTPMiddleware adds.
+    """
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wants(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        session, token = self.profiler.begin(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", session.profile_id.encode("ascii"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.end(session, token, status_code)
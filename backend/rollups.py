@@ -0,0 +1,116 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import Journey, FareLog, JourneyHourly, RevenueDaily, CoachRiders
+
+# Journeys started without a coach_id (single-reader setups) are counted here
+UNASSIGNED_COACH = "UNASSIGNED"
+
+
+def _bump(db, table, key, **increments):
+    """INSERT the key row with these counts, or add them to the existing row"""
+    db.execute(
+        insert(table).values(**key, **increments).on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: getattr(table, name) + value
+                  for name, value in increments.items()}
+        )
+    )
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record_journey_start(db, start_time, coach_id):
+    """Count a new ACTIVE journey. Does not commit."""
+    _bump(db, JourneyHourly, {"hour": _hour(start_time)}, started=1)
+    _bump(db, CoachRiders, {"coach_id": coach_id or UNASSIGNED_COACH},
+          active=1, boarded=1)
+
+
+def record_journey_end(db, end_time, coach_id, fare):
+    """Count an ended journey and the fare it was charged. Does not commit."""
+    _bump(db, JourneyHourly, {"hour": _hour(end_time)}, ended=1)
+    _bump(db, CoachRiders, {"coach_id": coach_id or UNASSIGNED_COACH}, active=-1)
+    _bump(db, RevenueDaily, {"day": end_time.date()}, fares=fare, fare_count=1)
+
+
+def record_fine(db, moment, amount):
+    """Count a violation fine. Does not commit."""
+    _bump(db, RevenueDaily, {"day": moment.date()}, fines=amount, fine_count=1)
+
+
+def record_top_up(db, moment, amount):
+    """Count funds added to a wallet. Does not commit."""
+    _bump(db, RevenueDaily, {"day": moment.date()}, top_ups=amount, top_up_count=1)
+
+
+def journeys_per_hour(db, start, end):
+    """Hourly rows with start <= hour < end"""
+    rows = db.query(JourneyHourly).filter(
+        JourneyHourly.hour >= _hour(start),
+        JourneyHourly.hour < end
+    ).order_by(JourneyHourly.hour).all()
+    return [{"hour": row.hour, "started": row.started, "ended": row.ended}
+            for row in rows]
+
+
+def revenue_per_day(db, start, end):
+    """Daily rows with start <= day <= end"""
+    rows = db.query(RevenueDaily).filter(
+        RevenueDaily.day >= start,
+        RevenueDaily.day <= end
+    ).order_by(RevenueDaily.day).all()
+    return [{
+        "day": row.day,
+        "fares": row.fares,
+        "fare_count": row.fare_count,
+        "fines": row.fines,
+        "fine_count": row.fine_count,
+        "top_ups": row.top_ups,
+        "top_up_count": row.top_up_count,
+    } for row in rows]
+
+
+def active_riders(db):
+    rows = db.query(CoachRiders).order_by(CoachRiders.coach_id).all()
+    return [{"coach_id": row.coach_id, "active": row.active, "boarded": row.boarded}
+            for row in rows]
+
+
+def rebuild(db):
+    """
+    Recompute every rollup from journeys and fare_logs.
+
+    Only needed once for a database that has history from before the rollups
+    existed; afterwards they are kept current by the record_* calls. Commits.
+    """
+    db.query(JourneyHourly).delete()
+    db.query(RevenueDaily).delete()
+    db.query(CoachRiders).delete()
+
+    for (start_time, coach_id, status, end_time) in db.query(
+            Journey.start_time, Journey.coach_id, Journey.status, Journey.end_time).all():
+        record_journey_start(db, start_time, coach_id)
+        if status == "ENDED" and end_time is not None:
+            _bump(db, JourneyHourly, {"hour": _hour(end_time)}, ended=1)
+            _bump(db, CoachRiders, {"coach_id": coach_id or UNASSIGNED_COACH}, active=-1)
+
+    for (moment, amount, journey_id, description) in db.query(
+            FareLog.timestamp, FareLog.amount, FareLog.journey_id, FareLog.description).all():
+        if journey_id == "NONE":
+            record_top_up(db, moment, amount)
+        elif (description or "").startswith("Safety violation fine"):
+            record_fine(db, moment, amount)
+        else:
+            _bump(db, RevenueDaily, {"day": moment.date()}, fares=amount, fare_count=1)
+
+    db.commit()
+
+
+def needs_rebuild(db):
+    """True for a database with journeys but no rollups yet"""
+    has_rollups = db.query(func.count()).select_from(JourneyHourly).scalar()
+    has_journeys = db.query(Journey.journey_id).first() is not None
+    return has_journeys and not has_rollups
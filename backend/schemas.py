@@ -0,0 +1,38 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class Sighting(BaseModel):
+    """One user seen by a reader in its latest scan"""
+    user_id: str
+    rssi: int
+
+
+class SightingBatch(BaseModel):
+    """All sightings one reader made in a scan cycle"""
+    reader_id: str
+    coach_id: str
+    sightings: List[Sighting]
+
+
+class ActiveJourneyQuery(BaseModel):
+    """User IDs (full or 8-char short) a reader wants journey status for"""
+    user_ids: List[str]
+
+
+# Bounds for sensor timestamps: 2020-01-01 .. 2100-01-01 UTC
+OCCURRED_AT_MIN = 1577836800.0
+OCCURRED_AT_MAX = 4102444800.0
+
+
+class ViolationEvent(BaseModel):
+    """One door-sensor violation; occurred_at is a unix timestamp"""
+    coach_id: str
+    door_id: str
+    occurred_at: Optional[float] = Field(
+        None, ge=OCCURRED_AT_MIN, lt=OCCURRED_AT_MAX, allow_inf_nan=False)
+
+
+class ViolationBatch(BaseModel):
+    """Violation events buffered by a sensor and sent together"""
+    events: List[ViolationEvent]
@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class SettlementWorker:
+    """
+    Settles queued journey exits in the background.
+
+    journey_end in async mode only inserts a PENDING row in the settlement
+    queue database (rail_poc_settlements.db) and returns. This worker calls
+    `settle_batch(limit)` - which prices and settles up to `limit` pending
+    exits in one transaction and returns how many it handled - every
+    `interval` seconds, or straight away when woken by notify(). Pending rows
+    survive a restart and are picked up on the next pass.
+    """
+
+    def __init__(self, settle_batch, batch_size=200, interval=0.5):
+        self.settle_batch = settle_batch
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.handled = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_batch_ms = None
+
+    def notify(self):
+        """A new exit was queued - settle it without waiting for the interval"""
+        self._wake.set()
+
+    def run_once(self):
+        """Settle one batch; returns the number of exits handled"""
+        started = time.perf_counter()
+        try:
+            handled = self.settle_batch(self.batch_size)
+        except Exception as e:
+            self.errors += 1
+            print(f"Settlement batch failed: {e}")
+            return 0
+
+        if handled:
+            self.last_batch_ms = round((time.perf_counter() - started) * 1000, 3)
+            self.batches += 1
+            self.handled += handled
+        return handled
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            while self.run_once() == self.batch_size and not self._stop.is_set():
+                pass
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="fare-settlement", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "handled": self.handled,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_batch_ms": self.last_batch_ms,
+        }
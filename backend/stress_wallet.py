@@ -0,0 +1,226 @@
+"""
+Wallet concurrency stress test for the Railway POC backend
+Hammers one wallet from many threads through the old ORM read-modify-write
+path and the atomic UPDATEs in wallet.py, and reports lost updates, double
+charges and throughput for each. Runs against a throwaway SQLite file.
+
+    python stress_wallet.py --threads 8 --ops 200 --races 50
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import User, Journey, FareLog
+from wallet import adjust_balance, charge_journey
+
+FARE = 20.0
+
+
+def make_session_factory(path):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def new_user(Session, balance):
+    db = Session()
+    try:
+        user_id = str(uuid.uuid4())
+        db.add(User(user_id=user_id, wallet_balance=balance))
+        db.commit()
+        return user_id
+    finally:
+        db.close()
+
+
+def balance_of(Session, user_id):
+    db = Session()
+    try:
+        return db.query(User.wallet_balance).filter(User.user_id == user_id).scalar()
+    finally:
+        db.close()
+
+
+# --- the two ways of changing a wallet --------------------------------------
+
+def orm_add_funds(db, user_id, amount):
+    """The pre-wallet.py add_funds: read the row, add in Python, commit"""
+    user = db.query(User).filter(User.user_id == user_id).first()
+    user.wallet_balance += amount
+    db.add(FareLog(user_id=user_id, journey_id="NONE", amount=amount,
+                   description="stress top-up"))
+    db.commit()
+
+
+def atomic_add_funds(db, user_id, amount):
+    adjust_balance(db, user_id, amount)
+    db.add(FareLog(user_id=user_id, journey_id="NONE", amount=amount,
+                   description="stress top-up"))
+    db.commit()
+
+
+def orm_end_journey(db, user_id):
+    """The pre-wallet.py journey_end; returns True if it charged"""
+    user = db.query(User).filter(User.user_id == user_id).first()
+    journey = db.query(Journey).filter(
+        Journey.user_id == user_id, Journey.status == "ACTIVE").first()
+    if not journey:
+        return False
+    user.wallet_balance -= FARE
+    journey.status = "ENDED"
+    journey.end_time = datetime.datetime.utcnow()
+    db.add(FareLog(user_id=user_id, journey_id=journey.journey_id,
+                   amount=FARE, description="stress fare"))
+    db.commit()
+    return True
+
+
+def atomic_end_journey(db, user_id):
+    journey_id = db.query(Journey.journey_id).filter(
+        Journey.user_id == user_id, Journey.status == "ACTIVE").scalar()
+    if not journey_id:
+        return False
+    charged = charge_journey(db, user_id, journey_id, FARE, "stress fare")
+    db.commit()
+    return charged is not None
+
+
+# --- scenarios --------------------------------------------------------------
+
+def run_threads(threads, work):
+    """Start `threads` copies of work(index) together; returns wall time and errors"""
+    errors = []
+    barrier = threading.Barrier(threads)
+
+    def runner(index):
+        barrier.wait()
+        try:
+            work(index)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=runner, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started, errors
+
+
+def top_up_storm(Session, add_funds, threads, ops):
+    """threads x ops top-ups of 1.0 on the same wallet"""
+    user_id = new_user(Session, 0.0)
+
+    def work(index):
+        db = Session()
+        try:
+            for _ in range(ops):
+                add_funds(db, user_id, 1.0)
+        finally:
+            db.close()
+
+    elapsed, errors = run_threads(threads, work)
+    expected = float(threads * ops)
+    actual = balance_of(Session, user_id)
+    return {
+        "expected": expected,
+        "actual": actual,
+        "lost_updates": int(expected - actual),
+        "errors": len(errors),
+        "ops_per_s": round(threads * ops / elapsed, 1),
+    }
+
+
+def exit_races(Session, end_journey, threads, races):
+    """`races` journeys, each ended by `threads` readers at the same moment"""
+    user_id = new_user(Session, 10_000.0)
+    double_charges = 0
+    errors = 0
+    elapsed_total = 0.0
+
+    for _ in range(races):
+        db = Session()
+        db.add(Journey(journey_id=str(uuid.uuid4()), user_id=user_id, status="ACTIVE"))
+        db.commit()
+        db.close()
+
+        charged = []
+
+        def work(index):
+            db = Session()
+            try:
+                if end_journey(db, user_id):
+                    charged.append(index)
+            finally:
+                db.close()
+
+        elapsed, failed = run_threads(threads, work)
+        elapsed_total += elapsed
+        errors += len(failed)
+        double_charges += max(0, len(charged) - 1)
+
+    expected = 10_000.0 - races * FARE
+    return {
+        "expected": expected,
+        "actual": balance_of(Session, user_id),
+        "double_charges": double_charges,
+        "errors": errors,
+        "races_per_s": round(races / elapsed_total, 1),
+    }
+
+
+def print_result(name, result):
+    details = ", ".join(f"{key}={value}" for key, value in result.items())
+    print(f"   {name:<8} {details}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200,
+                        help="top-ups per thread")
+    parser.add_argument("--races", type=int, default=50,
+                        help="journeys ended concurrently by every thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = make_session_factory(os.path.join(tmp, "stress.db"))
+
+        print(f"\n💰 Top-up storm: {args.threads} threads x {args.ops} top-ups on one wallet")
+        orm = top_up_storm(Session, orm_add_funds, args.threads, args.ops)
+        atomic = top_up_storm(Session, atomic_add_funds, args.threads, args.ops)
+        print_result("orm", orm)
+        print_result("atomic", atomic)
+
+        print(f"\n🚪 Exit races: {args.races} journeys, each ended by {args.threads} threads at once")
+        orm_races = exit_races(Session, orm_end_journey, args.threads, args.races)
+        atomic_races = exit_races(Session, atomic_end_journey, args.threads, args.races)
+        print_result("orm", orm_races)
+        print_result("atomic", atomic_races)
+
+        engine.dispose()
+
+    ok = (atomic["lost_updates"] == 0 and atomic["errors"] == 0
+          and atomic_races["double_charges"] == 0 and atomic_races["errors"] == 0
+          and atomic_races["actual"] == atomic_races["expected"])
+    print(f"\n{'✅' if ok else '❌'} Atomic path: "
+          f"{'no lost updates or double charges' if ok else 'FAILED'}\n")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
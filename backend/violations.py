@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class QueueFull(Exception):
+    """The violation buffer has no room for the events offered"""
+
+
+class ViolationIngest:
+    """
+    Buffers door-sensor violation events and writes them in bulk.
+
+    offer() only appends to a bounded in-memory queue under a lock, so a
+    sensor burst never holds up journey_start/journey_end requests. A
+    background thread drains up to `batch_size` events at a time and hands
+    them to `on_batch`, which does the database work in one transaction.
+
+    When the queue cannot take a whole batch the offer is rejected as a unit
+    (QueueFull) so the sensor can back off and resend.
+
+    Accepted events are never dropped: a batch that fails goes back to the
+    front of the queue and is retried after `flush_interval`. Once it has
+    failed `max_attempts` times it is written one event at a time, and any
+    event that still fails on its own is appended to `dead_letter_path`
+    (JSON lines) for someone to look at.
+    """
+
+    def __init__(self, on_batch, capacity=10000, batch_size=500,
+                 flush_interval=0.2, max_attempts=5, dead_letter_path=None):
+        self.on_batch = on_batch
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+
+        # ((coach_id, door_id, occurred_at), failed attempts) in arrival order
+        self._queue = deque()
+        self._retrying = False
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.dead_lettered = 0
+        self.last_batch_ms = None
+
+    def offer(self, events, now=None):
+        """
+        Queue violation events.
+
+        Args:
+            events: iterable of (coach_id, door_id, occurred_at or None)
+        Returns:
+            queue depth after the events were added
+        Raises:
+            QueueFull if there is not room for all of them
+        """
+        now = time.time() if now is None else now
+        events = [(coach_id, door_id, occurred_at or now)
+                  for coach_id, door_id, occurred_at in events]
+
+        with self._lock:
+            if len(self._queue) + len(events) > self.capacity:
+                self.rejected += len(events)
+                raise QueueFull(
+                    f"Violation queue full ({len(self._queue)}/{self.capacity})")
+            self._queue.extend((event, 0) for event in events)
+            self.accepted += len(events)
+            depth = len(self._queue)
+            if depth >= self.batch_size:
+                self._ready.notify()
+
+        return depth
+
+    def flush(self):
+        """Write one batch of whatever is queued; returns the number written"""
+        with self._lock:
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+
+        if not batch:
+            return 0
+
+        attempts = max(failures for _, failures in batch)
+        if attempts >= self.max_attempts:
+            return self._write_singly(batch)
+
+        started = time.perf_counter()
+        try:
+            self.on_batch([event for event, _ in batch])
+        except Exception as e:
+            self.errors += 1
+            print(f"Violation batch of {len(batch)} failed "
+                  f"(attempt {attempts + 1}/{self.max_attempts}): {e}")
+            self._requeue([(event, attempts + 1) for event, _ in batch])
+            return 0
+
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.batches += 1
+        self.written += len(batch)
+        self._retrying = False
+        return len(batch)
+
+    def _write_singly(self, batch):
+        """Last resort for a batch that keeps failing: isolate the bad events"""
+        written = 0
+        for event, _ in batch:
+            try:
+                self.on_batch([event])
+            except Exception as e:
+                self.errors += 1
+                self._dead_letter(event, e)
+            else:
+                written += 1
+        self.batches += 1
+        self.written += written
+        self._retrying = False
+        return written
+
+    def _requeue(self, batch):
+        # Already acknowledged to the sensor, so capacity does not apply
+        with self._lock:
+            self._queue.extendleft(reversed(batch))
+            self._retrying = True
+
+    def _dead_letter(self, event, error):
+        coach_id, door_id, occurred_at = event
+        self.dead_lettered += 1
+        print(f"Violation from coach {coach_id} door {door_id} dead-lettered: {error}")
+        if self.dead_letter_path is None:
+            return
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps({
+                "coach_id": coach_id,
+                "door_id": door_id,
+                "occurred_at": occurred_at,
+                "error": str(error),
+                "dead_lettered_at": time.time(),
+            }) + "\n")
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if self._retrying or len(self._queue) < self.batch_size:
+                    self._ready.wait(self.flush_interval)
+            while self.flush() == self.batch_size:
+                pass
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="violation-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the worker, writing out anything still queued"""
+        if self._thread is not None:
+            self._stop.set()
+            with self._lock:
+                self._ready.notify()
+            self._thread.join()
+            self._thread = None
+        # Failed batches are requeued, so loop until each event has been
+        # written or dead-lettered
+        while self._queue:
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._queue)
+        return {
+            "queued": depth,
+            "capacity": self.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "dead_lettered": self.dead_lettered,
+            "last_batch_ms": self.last_batch_ms,
+        }
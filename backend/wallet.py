@@ -0,0 +1,76 @@
+import datetime
+
+from sqlalchemy import insert, update
+
+from models import User, Journey, FareLog
+
+
+def adjust_balance(db, user_id, delta):
+    """
+    Add delta (negative to charge) to a wallet in one UPDATE statement.
+
+    The new balance is computed by the database, so concurrent adjustments
+    can never overwrite each other.
+
+    db may be an ORM Session or a Core Connection (see fastpath.py), as for
+    the other helpers here.
+
+    Returns:
+        the new balance, or None for an unknown user. Does not commit.
+    """
+    row = db.execute(
+        update(User).where(User.user_id == user_id).values(
+            wallet_balance=User.wallet_balance + delta,
+            updated_at=datetime.datetime.utcnow()
+        ).returning(User.wallet_balance),
+        execution_options={"synchronize_session": False}
+    ).first()
+
+    if row is None:
+        return None
+    # SQLite hands back whole-number REALs from RETURNING as int
+    return float(row[0])
+
+
+def end_active_journey(db, journey_id, end_time=None):
+    """
+    Flip a journey from ACTIVE to ENDED, only if it is still ACTIVE.
+
+    Returns True if this call ended it, False if someone else already had.
+    Does not commit.
+    """
+    result = db.execute(
+        update(Journey).where(
+            Journey.journey_id == journey_id,
+            Journey.status == "ACTIVE"
+        ).values(
+            status="ENDED",
+            end_time=end_time or datetime.datetime.utcnow()
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    return result.rowcount == 1
+
+
+def charge_journey(db, user_id, journey_id, amount, description, end_time=None):
+    """
+    End an ACTIVE journey and charge its fare in one transaction.
+
+    The status flip goes first, so of several concurrent attempts to end the
+    same journey only one charges the wallet.
+
+    Returns:
+        the remaining balance, or None if the journey was not ACTIVE.
+        Does not commit.
+    """
+    if not end_active_journey(db, journey_id, end_time):
+        return None
+
+    balance = adjust_balance(db, user_id, -amount)
+    db.execute(insert(FareLog).values(
+        user_id=user_id,
+        journey_id=journey_id,
+        amount=amount,
+        description=description
+    ))
+    return balance
@@ -0,0 +1,181 @@
+"""
+Advertisement trace recording for the Railway POC scanner
+Writes the raw BLE advertisement stream (every advertisement as it arrives,
+with its own timestamp) to a compact gzip'd binary file and reads it back
+either advertisement by advertisement or as scan ticks shaped like
+BleakScanner.discover(return_adv=True)
+"""
+
+import gzip
+import struct
+import time
+from collections import namedtuple
+
+TRACE_MAGIC = b"RAILTRC1"
+
+# Record types
+RECORD_ADVERTISEMENT = 1
+RECORD_SCAN_END = 2
+
+_HEADER = struct.Struct("<Bdb")      # record type, timestamp, rssi
+_SCAN_END = struct.Struct("<Bd")     # record type, timestamp
+_MANUFACTURER = struct.Struct("<HB")  # company id, payload length
+
+# Stand-ins for bleak's BLEDevice / AdvertisementData - only the fields the scanner reads
+TraceDevice = namedtuple("TraceDevice", ["address", "name"])
+TraceAdvertisement = namedtuple(
+    "TraceAdvertisement",
+    ["rssi", "manufacturer_data", "service_data", "local_name"])
+
+
+def _short(data):
+    """Length-prefixed (1 byte) field - BLE payloads never exceed 255 bytes"""
+    return bytes((len(data),)) + data
+
+
+class TraceWriter:
+    """
+    Appends advertisements to a trace file.
+
+    Layout after the magic header is a gzip stream of records:
+        ADVERTISEMENT: type, timestamp, rssi, address, local_name,
+                       manufacturer_data entries, service_data entries
+        SCAN_END:      type, timestamp
+    Strings and payloads are 1-byte length prefixed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = gzip.open(path, "wb")
+        self._file.write(TRACE_MAGIC)
+        self.advertisements = 0
+        self.scans = 0
+
+    def write_advertisement(self, timestamp, address, advertisement_data):
+        rssi = max(-128, min(127, int(advertisement_data.rssi)))
+        manufacturer_data = advertisement_data.manufacturer_data or {}
+        service_data = advertisement_data.service_data or {}
+        local_name = (advertisement_data.local_name or "").encode("utf-8")[:255]
+
+        parts = [
+            _HEADER.pack(RECORD_ADVERTISEMENT, timestamp, rssi),
+            _short(address.encode("utf-8")),
+            _short(local_name),
+            bytes((len(manufacturer_data),)),
+        ]
+        for manufacturer_id, data in manufacturer_data.items():
+            parts.append(_MANUFACTURER.pack(manufacturer_id, len(data)))
+            parts.append(bytes(data))
+
+        parts.append(bytes((len(service_data),)))
+        for uuid, data in service_data.items():
+            parts.append(_short(uuid.encode("utf-8")))
+            parts.append(_short(bytes(data)))
+
+        self._file.write(b"".join(parts))
+        self.advertisements += 1
+
+    def detection_callback(self, device, advertisement_data):
+        """
+        Pass as BleakScanner(detection_callback=...) - records each
+        advertisement the moment bleak reports it, duplicates included.
+        """
+        self.write_advertisement(time.time(), device.address, advertisement_data)
+
+    def end_scan(self, timestamp):
+        """Mark the end of one discover() window (the point process_scan ran)"""
+        self._file.write(_SCAN_END.pack(RECORD_SCAN_END, timestamp))
+        self.scans += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _read_short(buf, pos):
+    length = buf[pos]
+    return buf[pos + 1:pos + 1 + length], pos + 1 + length
+
+
+def read_advertisements(path):
+    """
+    Yield every record in recording order:
+        ("advertisement", timestamp, TraceDevice, TraceAdvertisement)
+        ("scan_end", timestamp, None, None)
+    """
+    with gzip.open(path, "rb") as trace_file:
+        buf = trace_file.read()
+
+    if not buf.startswith(TRACE_MAGIC):
+        raise ValueError(f"{path} is not a scanner trace")
+
+    pos = len(TRACE_MAGIC)
+
+    while pos < len(buf):
+        record_type = buf[pos]
+
+        if record_type == RECORD_SCAN_END:
+            _, timestamp = _SCAN_END.unpack_from(buf, pos)
+            pos += _SCAN_END.size
+            yield "scan_end", timestamp, None, None
+            continue
+
+        if record_type != RECORD_ADVERTISEMENT:
+            raise ValueError(f"Corrupt trace record at byte {pos}")
+
+        _, timestamp, rssi = _HEADER.unpack_from(buf, pos)
+        pos += _HEADER.size
+        address, pos = _read_short(buf, pos)
+        local_name, pos = _read_short(buf, pos)
+
+        manufacturer_data = {}
+        count = buf[pos]
+        pos += 1
+        for _ in range(count):
+            manufacturer_id, length = _MANUFACTURER.unpack_from(buf, pos)
+            pos += _MANUFACTURER.size
+            manufacturer_data[manufacturer_id] = buf[pos:pos + length]
+            pos += length
+
+        service_data = {}
+        count = buf[pos]
+        pos += 1
+        for _ in range(count):
+            uuid, pos = _read_short(buf, pos)
+            data, pos = _read_short(buf, pos)
+            service_data[uuid.decode("utf-8")] = data
+
+        address = address.decode("utf-8")
+        local_name = local_name.decode("utf-8") or None
+        yield ("advertisement", timestamp, TraceDevice(address, local_name),
+               TraceAdvertisement(rssi, manufacturer_data, service_data, local_name))
+
+
+def read_scans(path):
+    """
+    Yield (timestamp, devices_dict, advertisements) for every recorded scan
+    window.
+
+    Advertisements are folded the way BleakScanner.discover() folds them -
+    the latest one per address wins - so devices_dict maps address ->
+    (TraceDevice, TraceAdvertisement) exactly as the live scanner saw it at
+    the scan-end timestamp. `advertisements` counts the raw records read for
+    the window, repeats from the same address included.
+    """
+    devices_dict = {}
+    advertisements = 0
+    timestamp = None
+
+    for kind, timestamp, device, advertisement in read_advertisements(path):
+        if kind == "scan_end":
+            yield timestamp, devices_dict, advertisements
+            devices_dict = {}
+            advertisements = 0
+        else:
+            devices_dict[device.address] = (device, advertisement)
+            advertisements += 1
+
+    # Trace cut off mid-scan (e.g. scanner killed) - still replay what we have
+    if devices_dict:
+        yield timestamp, devices_dict, advertisements
@@ -0,0 +1,150 @@
+"""
+Tracker benchmark for the Railway POC scanner
+Compares the old dict-walk exit detection with the heap-backed
+ProximityFilter using simulated tracked devices (no Bluetooth needed)
+"""
+
+import argparse
+import random
+import time
+
+from proximity import ProximityFilter, TrackedUser
+
+ENTER_RSSI = -55
+LEAVE_RSSI = -65
+EXIT_DELAY = 10
+SCAN_INTERVAL = 2.5
+
+
+def simulate_ticks(devices, ticks, seen_fraction, churn, seed=42):
+    """
+    Build a deterministic list of (timestamp, {user_id: rssi}) scan ticks.
+
+    Every tick a seen_fraction of the present riders advertise, and churn
+    riders leave the coach while the same number of new ones board.
+    """
+    rng = random.Random(seed)
+    present = [f"user{i:06d}" for i in range(devices)]
+    next_id = devices
+    result = []
+
+    now = 1000.0
+    for _ in range(ticks):
+        now += SCAN_INTERVAL
+        samples = {user_id: rng.uniform(-54, -40) for user_id in present
+                   if rng.random() < seen_fraction}
+        result.append((now, samples))
+
+        for _ in range(churn):
+            present[rng.randrange(len(present))] = f"user{next_id:06d}"
+            next_id += 1
+
+    # Quiet tail so everyone still tracked runs out
+    for _ in range(int(EXIT_DELAY / SCAN_INTERVAL) + 2):
+        now += SCAN_INTERVAL
+        result.append((now, {}))
+
+    return result
+
+
+def run_legacy(ticks):
+    """
+    Original scanner logic: nested dicts, walk everyone every tick.
+    Returns (exits, total seconds, seconds spent on the expiry walk).
+    """
+    detected_users = {}
+    exits = 0
+    expiry = 0.0
+    started = time.perf_counter()
+
+    for current_time, samples in ticks:
+        for user_id in samples:
+            if user_id not in detected_users:
+                detected_users[user_id] = {
+                    'last_seen': current_time,
+                    'journey_started': True
+                }
+            else:
+                detected_users[user_id]['last_seen'] = current_time
+
+        expiry_started = time.perf_counter()
+        users_to_remove = []
+        for user_id, info in detected_users.items():
+            if current_time - info['last_seen'] > EXIT_DELAY:
+                users_to_remove.append(user_id)
+        for user_id in users_to_remove:
+            del detected_users[user_id]
+        expiry += time.perf_counter() - expiry_started
+        exits += len(users_to_remove)
+
+    return exits, time.perf_counter() - started, expiry
+
+
+def run_filter(ticks):
+    """
+    Current scanner logic: ProximityFilter deadlines + slotted records.
+    Same return value as run_legacy; expiry is the filter's expire() step.
+    """
+    proximity = ProximityFilter(ENTER_RSSI, LEAVE_RSSI, 0, EXIT_DELAY, 0.4)
+    detected_users = {}
+    exits = 0
+    expiry = 0.0
+    started = time.perf_counter()
+
+    for current_time, samples in ticks:
+        entered = proximity._observe(current_time, samples)
+
+        expiry_started = time.perf_counter()
+        exited = proximity.expire(current_time)
+        expiry += time.perf_counter() - expiry_started
+
+        for user_id in samples:
+            info = detected_users.get(user_id)
+            if info is not None:
+                info.last_seen = current_time
+        for user_id in entered:
+            detected_users[user_id] = TrackedUser(current_time, True)
+
+        # Exit work is only for users the filter says are gone
+        for user_id in exited:
+            del detected_users[user_id]
+        exits += len(exited)
+
+    return exits, time.perf_counter() - started, expiry
+
+
+def report(title, ticks):
+    print(f"\n{title}")
+    print(f"   {'':<20}{'exits':>8}{'ms/scan':>12}{'expiry µs/scan':>17}")
+    for name, run in (("dict walk (old)", run_legacy),
+                      ("filter + heap", run_filter)):
+        exits, total, expiry = run(ticks)
+        print(f"   {name:<20}{exits:>8}{total * 1000 / len(ticks):>12.3f}"
+              f"{expiry * 1e6 / len(ticks):>17.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scanner exit tracking")
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--seen", type=float, default=0.9,
+                        help="fraction of riders advertising in each scan")
+    parser.add_argument("--churn", type=int, default=20,
+                        help="riders leaving (and boarding) per scan")
+    args = parser.parse_args()
+
+    print(f"Simulating {args.devices} tracked devices, {args.ticks} scans...")
+
+    report(f"Riders churning ({args.churn}/scan, {args.seen:.0%} seen per scan):",
+           simulate_ticks(args.devices, args.ticks, args.seen, args.churn))
+
+    # Everyone seen every scan and nobody leaves until the quiet tail
+    report("Nobody leaving until the quiet tail:",
+           simulate_ticks(args.devices, args.ticks, 1.0, 0))
+
+    print("\n   ms/scan: filter + heap also smooths RSSI and runs the naive shadow")
+    print("   model, which the old loop never did, so it is slower per scan overall.")
+
+
+if __name__ == "__main__":
+    main()
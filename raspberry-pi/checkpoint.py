@@ -0,0 +1,66 @@
+"""
+Tracker checkpointing for the Railway POC scanner
+Persists who is currently inside the coach so a restart can pick up where it
+left off instead of ending (and billing) every active journey
+"""
+
+import json
+import os
+import time
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, detected_users, proximity, coach_id, reader_id):
+    """
+    Atomically write the tracker state to path.
+
+    Written to a temp file and renamed over the old one, so a crash mid-write
+    leaves the previous checkpoint intact.
+    """
+    state = {
+        "version": CHECKPOINT_VERSION,
+        "saved_at": time.time(),
+        "coach_id": coach_id,
+        "reader_id": reader_id,
+        "users": [
+            {
+                "user_id": user_id,
+                "last_seen": info.last_seen,
+                "journey_started": info.journey_started,
+                "smoothed_rssi": proximity.smoothed_rssi(user_id),
+            }
+            for user_id, info in list(detected_users.items())
+        ],
+    }
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump(state, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(tmp_path, path)
+    return len(state["users"])
+
+
+def load_checkpoint(path, coach_id):
+    """
+    Read a checkpoint back.
+
+    Returns the list of saved users, or [] if there is no usable checkpoint
+    (missing, unreadable or from another coach). Old checkpoints are still
+    used: riders who left while the scanner was down simply exit on the
+    first scan, which ends their journeys as before.
+    """
+    try:
+        with open(path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return []
+
+    if state.get("version") != CHECKPOINT_VERSION:
+        return []
+    if state.get("coach_id") != coach_id:
+        return []
+
+    return state.get("users", [])
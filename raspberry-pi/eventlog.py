@@ -0,0 +1,144 @@
+"""
+Structured event logging for the Railway POC scanner
+JSON-lines records are handed to a queue on the scan loop and written by a
+background listener thread, so log I/O never blocks a scan
+"""
+
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import signal
+import sys
+
+# Per-device advertisement traces - high volume, sampled
+device_log = logging.getLogger("scanner.device")
+
+# Entry/exit decisions and other rare, always-recorded events
+event_log = logging.getLogger("scanner.events")
+
+_root = logging.getLogger("scanner")
+_listener = None
+_sampler = None
+
+# Order used when stepping verbosity up/down at runtime
+_LEVELS = [logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR]
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Let through one record in every `rate` (rate <= 1 keeps everything)"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if self.rate <= 1:
+            return True
+        if next(self._counter) % self.rate:
+            return False
+        record.fields = dict(getattr(record, "fields", None) or {},
+                             sample_rate=self.rate)
+        return True
+
+
+def setup_logging(level="INFO", path=None, sample_rate=10,
+                  max_bytes=5_000_000, backups=3):
+    """
+    Route all scanner.* loggers through a queue to a JSON-lines sink.
+
+    Args:
+        level: initial verbosity for scanner.* (entry/exit events ignore it)
+        path: rotating log file, or None for stderr
+        sample_rate: keep 1 in N per-device trace records
+    """
+    global _listener, _sampler
+
+    if path:
+        sink = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups)
+    else:
+        sink = logging.StreamHandler(sys.stderr)
+    sink.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    _root.propagate = False
+    set_level(level)
+
+    # Entry/exit decisions are always recorded whatever the verbosity
+    event_log.setLevel(logging.INFO)
+
+    _sampler = SampleFilter(sample_rate)
+    device_log.filters[:] = [_sampler]
+
+    _listener = logging.handlers.QueueListener(log_queue, sink)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush whatever is still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_level(level):
+    """Change scanner.* verbosity at runtime, e.g. set_level("DEBUG")"""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    _root.setLevel(level)
+    return logging.getLevelName(_root.getEffectiveLevel())
+
+
+def set_sample_rate(rate):
+    """Change how many per-device trace records are dropped (1 in N kept)"""
+    if _sampler is not None:
+        _sampler.rate = max(1, int(rate))
+
+
+def current_settings():
+    return {
+        "level": logging.getLevelName(_root.getEffectiveLevel()),
+        "sample_rate": _sampler.rate if _sampler is not None else 1,
+    }
+
+
+def _step_level(delta):
+    level = _root.getEffectiveLevel()
+    position = min(range(len(_LEVELS)), key=lambda i: abs(_LEVELS[i] - level))
+    position = max(0, min(len(_LEVELS) - 1, position + delta))
+    new_level = set_level(_LEVELS[position])
+    event_log.info("log_level_changed", extra={"fields": {"level": new_level}})
+
+
+def install_signal_handlers():
+    """SIGUSR1 = more detail, SIGUSR2 = less detail - no restart needed"""
+    signal.signal(signal.SIGUSR1, lambda sig, frame: _step_level(-1))
+    signal.signal(signal.SIGUSR2, lambda sig, frame: _step_level(+1))
+
+
+def log_event(name, **fields):
+    """Record an always-on event such as a journey entry or exit"""
+    event_log.info(name, extra={"fields": fields})
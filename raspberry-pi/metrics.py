@@ -0,0 +1,242 @@
+"""
+Health and performance metrics for the Railway POC scanner
+Collects scan-loop timings, throughput and backend call stats in memory and
+serves them as JSON from a small HTTP endpoint for fleet monitoring
+"""
+
+import asyncio
+import functools
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import eventlog
+
+
+class Summary:
+    """Last `size` observations of a duration, reported as count/avg/p50/p95/max"""
+
+    def __init__(self, size=500):
+        self._values = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self._values.append(value)
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        values = sorted(self._values)
+        if not values:
+            return {"count": self.count}
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(values[len(values) // 2] * 1000, 3),
+            "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+        }
+
+
+class Rate:
+    """Events per second over a sliding window"""
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self._events = deque()
+        self.total = 0
+
+    def add(self, count, now=None):
+        now = time.monotonic() if now is None else now
+        self._events.append((now, count))
+        self.total += count
+
+    def per_second(self, now=None):
+        now = time.monotonic() if now is None else now
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
+        if not self._events:
+            return 0.0
+        span = max(now - self._events[0][0], 1.0)
+        return round(sum(count for _, count in self._events) / span, 2)
+
+
+class BackendCall:
+    """Latency and error count for one backend endpoint"""
+
+    def __init__(self):
+        self.latency = Summary()
+        self.errors = 0
+
+    def snapshot(self):
+        calls = self.latency.count
+        return dict(self.latency.snapshot(),
+                    errors=self.errors,
+                    error_rate=round(self.errors / calls, 4) if calls else 0.0)
+
+
+class ScannerMetrics:
+    """
+    Everything the /metrics endpoint reports.
+
+    Written from the scan loop and the journey worker threads, read from the
+    HTTP thread; a single lock keeps the deques consistent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+        self.scan_cycle = Summary()
+        self.scan_processing = Summary()
+        self.extract_user_id = Summary()
+        self.advertisements = Rate()
+        self.matched = Rate()
+        self.backend = {}
+        self.scan_errors = 0
+
+        # Event-loop heartbeat: when it last ran and the worst stall seen
+        self.last_heartbeat = time.monotonic()
+        self.loop_lag = Summary()
+        self.max_loop_lag = 0.0
+
+        # name -> zero-arg callable, evaluated at scrape time
+        self.gauges = {}
+
+    def observe_cycle(self, seconds):
+        """One full scan-loop iteration: BLE discovery plus processing"""
+        with self._lock:
+            self.scan_cycle.observe(seconds)
+
+    def observe_processing(self, seconds, advertisements, matched,
+                           extract_seconds, extract_calls):
+        """One process_scan call; extract_user_id time is averaged per call"""
+        with self._lock:
+            self.scan_processing.observe(seconds)
+            self.advertisements.add(advertisements)
+            self.matched.add(matched)
+            if extract_calls:
+                self.extract_user_id.observe(extract_seconds / extract_calls)
+
+    def observe_call(self, name, seconds, ok):
+        with self._lock:
+            call = self.backend.get(name)
+            if call is None:
+                call = self.backend[name] = BackendCall()
+            call.latency.observe(seconds)
+            if not ok:
+                call.errors += 1
+
+    def timed(self, name):
+        """Decorator for backend calls that return True on success"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                ok = fn(*args, **kwargs)
+                self.observe_call(name, time.perf_counter() - started, ok)
+                return ok
+            return wrapper
+        return decorate
+
+    def observe_scan_error(self):
+        with self._lock:
+            self.scan_errors += 1
+
+    async def heartbeat(self, interval=0.1):
+        """
+        Runs on the scanner's event loop. Any lag beyond `interval` is time the
+        loop spent blocked (e.g. on a synchronous backend call).
+        """
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            with self._lock:
+                self.last_heartbeat = now
+                self.loop_lag.observe(lag)
+                self.max_loop_lag = max(self.max_loop_lag, lag)
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            data = {
+                "uptime_s": round(time.time() - self.started, 1),
+                "scan_cycle": self.scan_cycle.snapshot(),
+                "scan_processing": self.scan_processing.snapshot(),
+                "scan_errors": self.scan_errors,
+                "advertisements_per_s": self.advertisements.per_second(now),
+                "matched_per_s": self.matched.per_second(now),
+                "advertisements_total": self.advertisements.total,
+                "matched_total": self.matched.total,
+                "extract_user_id": self.extract_user_id.snapshot(),
+                "backend": {name: call.snapshot()
+                            for name, call in self.backend.items()},
+                "event_loop": {
+                    "blocked_for_s": round(now - self.last_heartbeat, 3),
+                    "lag": self.loop_lag.snapshot(),
+                    "max_lag_ms": round(self.max_loop_lag * 1000, 3),
+                },
+            }
+
+        for name, gauge in self.gauges.items():
+            try:
+                data[name] = gauge()
+            except Exception as e:
+                data[name] = f"error: {e}"
+
+        data["logging"] = eventlog.current_settings()
+        return data
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics - JSON snapshot, POST /logging?level=DEBUG&sample_rate=5"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if urlparse(self.path).path in ("/", "/metrics"):
+            self._reply(200, self.server.metrics.snapshot())
+        else:
+            self._reply(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/logging":
+            self._reply(404, {"detail": "Not Found"})
+            return
+
+        params = parse_qs(url.query)
+        try:
+            if "level" in params:
+                eventlog.set_level(params["level"][0])
+            if "sample_rate" in params:
+                eventlog.set_sample_rate(params["sample_rate"][0])
+        except (TypeError, ValueError) as e:
+            self._reply(400, {"detail": str(e)})
+            return
+        self._reply(200, eventlog.current_settings())
+
+
+def serve_metrics(metrics, host, port):
+    """Start the metrics HTTP server on a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.metrics = metrics
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics",
+                     daemon=True).start()
+    return server
@@ -0,0 +1,311 @@
+"""
+Smoothed RSSI proximity model for the Railway POC scanner
+Decides when a tracked device has entered or left the coach using an
+EWMA-filtered RSSI with separate enter/leave thresholds and dwell times
+"""
+
+import heapq
+import math
+import numpy as np
+
+
+class TrackedUser:
+    """Journey state for one user currently inside the coach"""
+    __slots__ = ('last_seen', 'journey_started')
+
+    def __init__(self, last_seen, journey_started=False):
+        self.last_seen = last_seen
+        self.journey_started = journey_started
+
+
+class ProximityFilter:
+    """
+    Per-device RSSI filter with entry/exit hysteresis.
+
+    State for every tracked device lives in parallel numpy arrays indexed by
+    slot, so each tick updates all devices seen in that scan in one
+    vectorized pass instead of a Python loop per device.
+
+    A device ENTERS once its smoothed RSSI has stayed at or above
+    enter_rssi for enter_dwell seconds. It LEAVES once it has not produced
+    a smoothed RSSI at or above leave_rssi for exit_delay seconds. Between
+    the two thresholds the current state is kept, which stops a phone
+    sitting on the boundary from flapping.
+
+    Exit deadlines live in a min-heap of buckets (one per distinct
+    deadline, i.e. per scan tick) and are re-armed lazily: a device is
+    armed once when it is first tracked, and being seen again does not
+    touch the heap. When a bucket comes due, one vectorized check releases
+    the slots whose real deadline has passed and re-arms the rest, grouped
+    by their real deadline. Each tracked device is therefore checked about
+    once per exit_delay rather than every tick, and ticks with no bucket
+    due cost one heap peek.
+
+    A shadow copy of the old single-sample model (raw RSSI >= naive_rssi,
+    fixed exit delay) runs alongside so we can report how many
+    journey_start/journey_end calls the filter suppressed.
+    """
+
+    def __init__(self, enter_rssi, leave_rssi, enter_dwell, exit_delay,
+                 alpha, naive_rssi=None, capacity=64):
+        self.enter_rssi = enter_rssi
+        self.leave_rssi = leave_rssi
+        self.enter_dwell = enter_dwell
+        self.exit_delay = exit_delay
+        self.alpha = alpha
+        self.naive_rssi = enter_rssi if naive_rssi is None else naive_rssi
+
+        # user_id -> slot index, and slot index -> user_id
+        self._slots = {}
+        self._ids = []
+        self._free = []
+
+        # Min-heap of distinct deadlines, and deadline -> [(slots, generations)]
+        # armed for it; the generation guards against reused slots
+        self._deadlines = []
+        self._buckets = {}
+
+        self._allocate(capacity)
+
+        # Backend calls the filtered model made vs. the naive model would have made
+        self.filtered_calls = 0
+        self.naive_calls = 0
+
+    def _allocate(self, capacity):
+        """Create (or grow) the per-slot state arrays to hold capacity devices"""
+        old = len(self._ids)
+
+        def grow(array, fill, dtype):
+            new = np.full(capacity, fill, dtype=dtype)
+            if array is not None:
+                new[:old] = array[:old]
+            return new
+
+        self.smoothed = grow(getattr(self, 'smoothed', None), np.nan, np.float64)
+        self.above_since = grow(getattr(self, 'above_since', None), np.nan, np.float64)
+        self.last_inside = grow(getattr(self, 'last_inside', None), np.nan, np.float64)
+        self.last_sample = grow(getattr(self, 'last_sample', None), np.nan, np.float64)
+        self.inside = grow(getattr(self, 'inside', None), False, np.bool_)
+        self.naive_inside = grow(getattr(self, 'naive_inside', None), False, np.bool_)
+        self.naive_last_seen = grow(getattr(self, 'naive_last_seen', None), np.nan, np.float64)
+        self.generation = grow(getattr(self, 'generation', None), 0, np.int64)
+
+        self._ids.extend([None] * (capacity - old))
+        self._free.extend(range(capacity - 1, old - 1, -1))
+
+    def _slot_for(self, user_id):
+        """Return the slot for user_id, claiming a fresh one if needed"""
+        slot = self._slots.get(user_id)
+        if slot is not None:
+            return slot
+
+        if not self._free:
+            self._allocate(len(self._ids) * 2)
+
+        slot = self._free.pop()
+        self._slots[user_id] = slot
+        self._ids[slot] = user_id
+        self.smoothed[slot] = np.nan
+        self.above_since[slot] = np.nan
+        self.last_inside[slot] = np.nan
+        self.inside[slot] = False
+        self.naive_inside[slot] = False
+        self.naive_last_seen[slot] = np.nan
+        self.generation[slot] += 1
+        return slot
+
+    def _deadlines_for(self, slots):
+        """When slots time out: exit for devices inside, eviction otherwise"""
+        inside = self.inside[slots]
+        last = np.where(inside, self.last_inside[slots], self.last_sample[slots])
+        return last + self.exit_delay
+
+    def _arm(self, slots, deadline):
+        """Add slots to the bucket that times out at deadline"""
+        bucket = self._buckets.get(deadline)
+        if bucket is None:
+            bucket = self._buckets[deadline] = []
+            heapq.heappush(self._deadlines, deadline)
+        bucket.append((slots, self.generation[slots]))
+
+    def _rearm(self, slots, deadlines):
+        """Put slots back, grouped by deadline (devices seen in one scan share it)"""
+        values, groups = np.unique(deadlines, return_inverse=True)
+        if len(values) == 1:
+            self._arm(slots, float(values[0]))
+            return
+        order = np.argsort(groups, kind="stable")
+        bounds = np.searchsorted(groups[order], np.arange(1, len(values)))
+        for deadline, group in zip(values.tolist(), np.split(slots[order], bounds)):
+            self._arm(group, deadline)
+
+    def _release(self, slots):
+        """Free slots of devices that are no longer tracked"""
+        # A device still "inside" under the naive model would have been ended there too
+        self.naive_calls += int(np.count_nonzero(self.naive_inside[slots]))
+
+        for slot in slots.tolist():
+            del self._slots[self._ids[slot]]
+            self._ids[slot] = None
+            self._free.append(slot)
+
+        self.inside[slots] = False
+        self.naive_inside[slots] = False
+        self.generation[slots] += 1
+
+    def update(self, now, samples):
+        """
+        Feed one scan tick into the filter.
+
+        Args:
+            now: Timestamp of the tick (seconds)
+            samples: {user_id: rssi} for every device seen this tick
+
+        Returns:
+            (entered, exited) lists of user_ids whose state changed
+        """
+        entered = self._observe(now, samples)
+        exited = self.expire(now)
+        self.filtered_calls += len(entered) + len(exited)
+        return entered, exited
+
+    def _observe(self, now, samples):
+        """Apply one tick of samples; returns the user_ids that entered"""
+        entered = []
+
+        if samples:
+            slots = self._slots
+            idx = [slots.get(user_id, -1) for user_id in samples]
+            new_slots = None
+            if -1 in idx:
+                new_slots = [self._slot_for(user_id)
+                             for user_id, slot in zip(samples, idx) if slot == -1]
+                idx = [slots[user_id] for user_id in samples]
+            idx = np.array(idx, dtype=np.intp)
+            rssi = np.fromiter(samples.values(), dtype=np.float64,
+                               count=len(samples))
+
+            # EWMA - first sample for a device seeds the filter
+            previous = self.smoothed[idx]
+            smoothed = np.where(
+                np.isnan(previous), rssi,
+                self.alpha * rssi + (1.0 - self.alpha) * previous)
+            self.smoothed[idx] = smoothed
+            self.last_sample[idx] = now
+
+            # Track how long each device has been continuously above the enter line
+            above = smoothed >= self.enter_rssi
+            since = self.above_since[idx]
+            since = np.where(above, np.where(np.isnan(since), now, since), np.nan)
+            self.above_since[idx] = since
+
+            in_range = smoothed >= self.leave_rssi
+            self.last_inside[idx] = np.where(in_range, now, self.last_inside[idx])
+
+            entering = ~self.inside[idx] & above & (now - since >= self.enter_dwell)
+            entering_slots = idx[entering]
+            self.inside[entering_slots] = True
+            self.last_inside[entering_slots] = now
+            entered = [self._ids[slot] for slot in entering_slots.tolist()]
+
+            # Shadow of the old model: single raw sample in, fixed delay out
+            raw_above = rssi >= self.naive_rssi
+            naive_inside = self.naive_inside[idx]
+            naive_expired = naive_inside & (now - self.naive_last_seen[idx] > self.exit_delay)
+            naive_inside &= ~naive_expired
+            naive_entering = raw_above & ~naive_inside
+            self.naive_calls += int(np.count_nonzero(naive_expired))
+            self.naive_calls += int(np.count_nonzero(naive_entering))
+            self.naive_inside[idx] = naive_inside | naive_entering
+            self.naive_last_seen[idx] = np.where(raw_above, now, self.naive_last_seen[idx])
+
+            # Only newly tracked devices are armed; the rest already have a deadline
+            if new_slots:
+                self._arm(np.array(new_slots, dtype=np.intp), now + self.exit_delay)
+
+        return entered
+
+    def expire(self, now):
+        """
+        Release devices whose deadline has passed; returns the user_ids that
+        exited (devices that never entered are dropped silently).
+        """
+        # Pop only the buckets whose deadline has come up
+        exited = []
+        deadlines = self._deadlines
+        while deadlines and deadlines[0] < now:
+            bucket = self._buckets.pop(heapq.heappop(deadlines))
+            if len(bucket) == 1:
+                slots, generations = bucket[0]
+            else:
+                slots = np.concatenate([entry[0] for entry in bucket])
+                generations = np.concatenate([entry[1] for entry in bucket])
+
+            # Drop slots released (and maybe reused) since they were armed
+            slots = slots[self.generation[slots] == generations]
+            if not slots.size:
+                continue
+
+            real = self._deadlines_for(slots)
+            due = real < now
+            due_slots = slots[due]
+
+            # Seen since arming - re-arm at the real deadline
+            if not due.all():
+                self._rearm(slots[~due], real[~due])
+
+            if due_slots.size:
+                exited.extend(self._ids[slot] for slot in
+                              due_slots[self.inside[due_slots]].tolist())
+                self._release(due_slots)
+
+        return exited
+
+    def restore(self, user_id, last_inside, smoothed_rssi=None):
+        """
+        Put a user back inside after a restart, as last seen in range at
+        last_inside. Their exit deadline runs from that time, so riders who
+        left while the scanner was down exit on the next update().
+        """
+        slot = self._slot_for(user_id)
+        self.smoothed[slot] = self.enter_rssi if smoothed_rssi is None else smoothed_rssi
+        self.last_inside[slot] = last_inside
+        self.last_sample[slot] = last_inside
+        self.inside[slot] = True
+        self._arm(np.array([slot], dtype=np.intp), last_inside + self.exit_delay)
+
+    def in_range(self, now):
+        """
+        {user_id: smoothed RSSI} for devices that have entered and whose
+        smoothed RSSI was still at or above leave_rssi at tick `now`
+        """
+        slots = np.flatnonzero(self.inside & (self.last_inside == now))
+        return {self._ids[slot]: float(self.smoothed[slot]) for slot in slots.tolist()}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def tracks(self, user_id):
+        """True while user_id has filter state (inside, entering or timing out)"""
+        return user_id in self._slots
+
+    def smoothed_rssi(self, user_id):
+        """Current smoothed RSSI for user_id, or None if not tracked"""
+        slot = self._slots.get(user_id)
+        if slot is None or math.isnan(self.smoothed[slot]):
+            return None
+        return float(self.smoothed[slot])
+
+    @property
+    def suppressed_calls(self):
+        """Backend calls the naive single-sample model would have made on top of ours"""
+        return max(0, self.naive_calls - self.filtered_calls)
+
+    def stats(self):
+        """Snapshot of filter counters"""
+        return {
+            'tracked_devices': len(self._slots),
+            'filtered_calls': self.filtered_calls,
+            'naive_calls': self.naive_calls,
+            'suppressed_calls': self.suppressed_calls,
+        }
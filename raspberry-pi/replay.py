@@ -0,0 +1,164 @@
+"""
+Offline replay driver for the Railway POC scanner
+Feeds a recorded advertisement trace through scanner.process_scan against a
+local stand-in backend, so the scanner can be benchmarked and regression
+tested without a phone or a Bluetooth adapter.
+
+Record a trace on the Pi:   python3 scanner.py --record ride.trace
+Replay it anywhere:         python3 replay.py ride.trace --speed 0
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import eventlog
+import scanner
+from adv_trace import read_scans
+
+
+class StandInBackend(BaseHTTPRequestHandler):
+    """
+    Minimal backend that answers journey_start/journey_end like backend/main.py.
+    Every call is appended to server.decisions for the replay report.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._reply(200, {"status": "Replay stand-in backend", "version": "1.0"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        user_id = parse_qs(url.query).get("user_id", [""])[0]
+        active = self.server.active_journeys
+
+        with self.server.lock:
+            if url.path == "/journey_start":
+                journey_id = active.setdefault(user_id, str(uuid.uuid4()))
+                self.server.decisions.append(
+                    (self.server.trace_time, "START", user_id))
+                self._reply(200, {"message": "Journey started",
+                                  "journey_id": journey_id, "user_id": user_id})
+            elif url.path == "/journey_end":
+                journey_id = active.pop(user_id, None)
+                self.server.decisions.append(
+                    (self.server.trace_time, "END", user_id))
+                if journey_id is None:
+                    self._reply(404, {"detail": "No active journey found"})
+                else:
+                    self._reply(200, {"message": "Journey ended, fare deducted",
+                                      "journey_id": journey_id,
+                                      "fare_amount": 20.0,
+                                      "remaining_balance": 0.0})
+            else:
+                self._reply(404, {"detail": "Not Found"})
+
+
+def start_backend(port):
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInBackend)
+    server.lock = threading.Lock()
+    server.decisions = []
+    server.active_journeys = {}
+    server.trace_time = 0.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def replay(path, speed, drain, server):
+    """
+    Drive scanner.process_scan with every scan in the trace.
+
+    speed: 0 replays as fast as possible, otherwise N x the recorded pace.
+    drain: keep ticking with empty scans afterwards so remaining riders exit.
+    """
+    scans = 0
+    advertisements = 0
+    first = last = None
+    replay_started = time.perf_counter()
+
+    for timestamp, devices_dict, raw_advertisements in read_scans(path):
+        if first is None:
+            first = timestamp
+        elif speed:
+            # Sleep until this scan is due at the accelerated pace
+            due = replay_started + (timestamp - first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        server.trace_time = timestamp - first
+        scanner.process_scan(devices_dict, timestamp)
+        scans += 1
+        advertisements += raw_advertisements
+        last = timestamp
+
+    if drain and last is not None:
+        now = last
+        give_up = last + scanner.EXIT_DELAY_SECONDS + 2 * scanner.SCAN_INTERVAL
+        while scanner.detected_users and now < give_up:
+            now += scanner.SCAN_INTERVAL
+            server.trace_time = now - first
+            scanner.process_scan({}, now)
+
+    elapsed = time.perf_counter() - replay_started
+    return scans, advertisements, (last - first) if first is not None else 0.0, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded scanner trace")
+    parser.add_argument("trace", help="trace file written by scanner.py --record")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="replay speed multiplier (0 = as fast as possible)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="port for the local stand-in backend")
+    parser.add_argument("--no-drain", action="store_true",
+                        help="do not flush riders still tracked at the end of the trace")
+    parser.add_argument("--log", metavar="PATH",
+                        help="write the scanner's JSON-lines event log here")
+    parser.add_argument("--debug", action="store_true",
+                        help="include every per-device trace record in the log")
+    args = parser.parse_args()
+
+    server = start_backend(args.port)
+    scanner.BACKEND_URL = f"http://127.0.0.1:{args.port}"
+    if args.log or args.debug:
+        eventlog.setup_logging("DEBUG" if args.debug else "INFO", args.log,
+                               sample_rate=1)
+
+    print(f"▶️  Replaying {args.trace} against {scanner.BACKEND_URL}\n")
+    scans, advertisements, trace_span, elapsed = replay(
+        args.trace, args.speed, not args.no_drain, server)
+    server.shutdown()
+    eventlog.shutdown_logging()
+
+    print("\n" + "=" * 60)
+    print("📼 REPLAY SUMMARY")
+    print("=" * 60)
+    print(f"Scans:           {scans}")
+    print(f"Advertisements:  {advertisements}")
+    print(f"Trace span:      {trace_span:.1f}s, replayed in {elapsed:.2f}s")
+    if elapsed > 0:
+        print(f"Throughput:      {advertisements / elapsed:,.0f} events/s")
+    print(f"Suppressed:      {scanner.proximity.suppressed_calls} backend call(s)")
+
+    print(f"\nJourney decisions ({len(server.decisions)}):")
+    for offset, decision, user_id in server.decisions:
+        print(f"   +{offset:8.1f}s  {decision:<5}  {user_id[:8]}")
+
+
+if __name__ == "__main__":
+    main()
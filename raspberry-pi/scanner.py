@@ -3,14 +3,26 @@ Raspberry Pi BLE Scanner for Railway POC
 Detects Android phone BLE advertisements and manages journey lifecycle
 """
 
+import argparse
 import asyncio
+import logging
 import requests
 import time
+import os
 import signal
+import socket
 import sys
 import atexit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from bleak import BleakScanner
+from proximity import ProximityFilter, TrackedUser
+from adv_trace import TraceWriter
+from user_directory import UserDirectory
+import eventlog
+from eventlog import device_log, log_event
+from metrics import ScannerMetrics, serve_metrics
+from checkpoint import save_checkpoint, load_checkpoint
 
 # Backend configuration - CHANGE THIS TO YOUR MACBOOK IP
 BACKEND_URL = "http://192.168.31.187:8000"
@@ -20,152 +32,171 @@ BACKEND_URL = "http://192.168.31.187:8000"
 # -60 dBm = close proximity (~2-3 meters)
 # -70 dBm = medium range (~3-5 meters)
 # -80 dBm = far range (~5-8 meters)
-RSSI_THRESHOLD = -55  # Only detect when phone is VERY close (~1-2 meters)
+ENTER_RSSI_THRESHOLD = -55  # Only detect when phone is VERY close (~1-2 meters)
+
+# Smoothed RSSI must drop below this before a user counts as out of range.
+# The gap to ENTER_RSSI_THRESHOLD is the hysteresis band where state is kept.
+LEAVE_RSSI_THRESHOLD = -65
+
+# Smoothed RSSI must stay above ENTER_RSSI_THRESHOLD this long before a journey starts
+ENTER_DWELL_SECONDS = 2
 
 # Exit detection delay (seconds)
-# User is considered "exited" only if not detected for this duration
+# User is considered "exited" only if not in range for this duration
 EXIT_DELAY_SECONDS = 10
 
+# EWMA weight of the newest RSSI sample (1.0 = no smoothing)
+RSSI_SMOOTHING_ALPHA = 0.4
+
 # Scan interval (seconds)
 SCAN_INTERVAL = 2
 
-# Debug mode - set to True to see all detected BLE devices
-DEBUG_MODE = True
+# Coach this reader is mounted in, and a unique name for the reader itself
+COACH_ID = "C1"
+READER_ID = socket.gethostname()
+
+# Fusion mode - for coaches with more than one reader.
+# When True the scanner only reports sightings to the backend's /sightings
+# endpoint and the backend decides entry/exit across all readers.
+FUSION_MODE = False
+
+# Async fare settlement - journey_end returns as soon as the backend has
+# recorded the exit; the fare is deducted by a backend worker shortly after
+ASYNC_SETTLEMENT = False
+
+# How often the local user directory pulls changes from the backend (seconds)
+DIRECTORY_SYNC_INTERVAL = 30
+
+# Tracker checkpoint - written every CHECKPOINT_INTERVAL seconds and on shutdown,
+# restored on startup so a restart/deploy doesn't end everyone's journey
+CHECKPOINT_FILE = "tracker_state.json"
+CHECKPOINT_INTERVAL = 15
+
+# Old behaviour: end (and bill) every tracked journey when the scanner stops
+END_JOURNEYS_ON_SHUTDOWN = False
+
+# Structured JSON-lines log (written off the scan loop by a background thread)
+# INFO records entry/exit decisions only; DEBUG adds per-device traces.
+# Change at runtime: kill -USR1 <pid> = more detail, kill -USR2 <pid> = less
+LOG_LEVEL = "INFO"
+LOG_FILE = "scanner.log.jsonl"
+
+# Keep 1 in N per-device trace records when LOG_LEVEL is DEBUG
+DEVICE_TRACE_SAMPLE_RATE = 10
+
+# Health/performance metrics endpoint: GET http://<pi>:9100/metrics
+# Set METRICS_PORT = None to disable
+METRICS_HOST = "0.0.0.0"
+METRICS_PORT = 9100
 
 # YOUR ANDROID PHONE'S MANUFACTURER ID (0xFFFF = 65535)
 # This matches BleAdvertisingService.kt MANUFACTURER_ID
 TARGET_MANUFACTURER_ID = 0xFFFF  # 65535 in decimal
 
 # Track currently detected users
-# Format: {user_id: {'last_seen': timestamp, 'journey_started': bool}}
+# Format: {user_id: TrackedUser(last_seen, journey_started)}
+# Exit deadlines are kept by the proximity filter, so this is never walked per scan
 detected_users = {}
 
+# Smoothed proximity model - decides entry/exit for every tracked device
+proximity = ProximityFilter(
+    enter_rssi=ENTER_RSSI_THRESHOLD,
+    leave_rssi=LEAVE_RSSI_THRESHOLD,
+    enter_dwell=ENTER_DWELL_SECONDS,
+    exit_delay=EXIT_DELAY_SECONDS,
+    alpha=RSSI_SMOOTHING_ALPHA
+)
+
+# Scan-loop and backend call metrics served on METRICS_PORT
+metrics = ScannerMetrics()
+metrics.gauges["tracked_users"] = lambda: len(detected_users)
+metrics.gauges["suppressed_calls"] = lambda: proximity.suppressed_calls
+metrics.gauges["unknown_ids_dropped"] = lambda: user_directory.dropped if user_directory else 0
+
 # Global flag for graceful shutdown
 shutdown_flag = False
 
 # Store active scanner reference for cleanup
 active_scanner = None
 
+# Local copy of registered short IDs - unknown IDs are dropped at the edge
+user_directory = None
+
+# Runs journey_start for riders the directory already vouches for, off the scan loop
+journey_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="journey")
+
+# Checkpointing starts once the previous checkpoint has been restored,
+# so an early exit can never overwrite it with an empty tracker
+checkpoint_enabled = False
+last_checkpoint = 0.0
+
+# Advertisement trace being recorded (--record), replayable with replay.py
+trace_writer = None
+
+# BLE address -> user_id for devices the proximity filter is tracking, so weak
+# samples from riders already on board still reach it without decoding every
+# weak advertisement in range
+device_users = {}
+
+
+def _parse_rail_payload(payload):
+    """Return the user_id carried in a RAIL:: or RAIL_USER:: payload, or None"""
+    # Check for SHORT format: RAIL::xxxxxxxx (14 bytes)
+    if 'RAIL::' in payload:
+        user_id = payload.split('RAIL::')[1]
+    # Check for LONG format: RAIL_USER::uuid (for backwards compat)
+    elif 'RAIL_USER::' in payload:
+        user_id = payload.split('RAIL_USER::')[1]
+    else:
+        return None
+    return user_id.strip().split('\x00')[0]
+
 
 def extract_user_id(device, advertisement_data):
     """
     Extract user_id from BLE advertisement data.
     Checks ALL manufacturer_data and ALL service_data for RAIL:: or RAIL_USER:: pattern.
     """
-    if DEBUG_MODE:
-        print(f"🔍 Checking device: {device.address}")
-
     try:
         # CHECK ALL MANUFACTURER DATA
-        if advertisement_data.manufacturer_data:
-            if DEBUG_MODE:
-                print(
-                    f"   📦 Manufacturer data found: {list(advertisement_data.manufacturer_data.keys())}")
-
-            for manufacturer_id, data in advertisement_data.manufacturer_data.items():
-                try:
-                    # Highlight if this is OUR phone's manufacturer ID
-                    is_our_phone = (manufacturer_id == TARGET_MANUFACTURER_ID)
-
-                    if DEBUG_MODE:
-                        if is_our_phone:
-                            print(
-                                f"   🎯 *** YOUR PHONE DETECTED! *** Manufacturer ID: {hex(manufacturer_id)}")
-                        else:
-                            print(
-                                f"   🏭 Manufacturer ID: {hex(manufacturer_id)} (not our phone)")
-                        print(f"   📦 Raw data ({len(data)} bytes): {data}")
-
-                    # Try decoding as UTF-8
-                    payload = data.decode('utf-8', errors='ignore')
-
-                    if DEBUG_MODE:
-                        print(f"   📝 Decoded: {payload}")
-
-                    # Check for SHORT format: RAIL::xxxxxxxx (14 bytes)
-                    if 'RAIL::' in payload:
-                        user_id = payload.split('RAIL::')[1].strip()
-                        if '\x00' in user_id:
-                            user_id = user_id.split('\x00')[0]
-                        print(f"   ✅ Found user (short): {user_id}")
-                        return user_id
-
-                    # Check for LONG format: RAIL_USER::uuid (for backwards compat)
-                    if 'RAIL_USER::' in payload:
-                        user_id = payload.split('RAIL_USER::')[1].strip()
-                        if '\x00' in user_id:
-                            user_id = user_id.split('\x00')[0]
-                        print(f"   ✅ Found user (long): {user_id[:8]}...")
-                        return user_id
-
-                except Exception as e:
-                    if DEBUG_MODE:
-                        print(
-                            f"   ⚠️  Could not decode manufacturer_data: {e}")
-        else:
-            if DEBUG_MODE:
-                print(f"   ⚠️  No manufacturer_data found")
+        for manufacturer_id, data in (advertisement_data.manufacturer_data or {}).items():
+            user_id = _parse_rail_payload(data.decode('utf-8', errors='ignore'))
+            if user_id:
+                return user_id
 
         # CHECK ALL SERVICE DATA
-        if advertisement_data.service_data:
-            if DEBUG_MODE:
-                print(
-                    f"   🔑 Service data found: {list(advertisement_data.service_data.keys())}")
-
-            for uuid, data in advertisement_data.service_data.items():
-                try:
-                    if DEBUG_MODE:
-                        print(f"   🔑 Service UUID: {uuid}")
-                        print(f"   📦 Raw data ({len(data)} bytes): {data}")
-
-                    payload = data.decode('utf-8', errors='ignore')
-
-                    if DEBUG_MODE:
-                        print(f"   📝 Decoded: {payload}")
-
-                    # Check for SHORT format
-                    if 'RAIL::' in payload:
-                        user_id = payload.split('RAIL::')[1].strip()
-                        if '\x00' in user_id:
-                            user_id = user_id.split('\x00')[0]
-                        print(f"   ✅ Found user (short): {user_id}")
-                        return user_id
-
-                    # Check for LONG format
-                    if 'RAIL_USER::' in payload:
-                        user_id = payload.split('RAIL_USER::')[1].strip()
-                        if '\x00' in user_id:
-                            user_id = user_id.split('\x00')[0]
-                        print(f"   ✅ Found user (long): {user_id[:8]}...")
-                        return user_id
-
-                except Exception as e:
-                    if DEBUG_MODE:
-                        print(f"   ⚠️  Could not decode service_data: {e}")
-        else:
-            if DEBUG_MODE:
-                print(f"   ⚠️  No service_data found")
+        for uuid, data in (advertisement_data.service_data or {}).items():
+            user_id = _parse_rail_payload(data.decode('utf-8', errors='ignore'))
+            if user_id:
+                return user_id
 
         # ALSO CHECK LOCAL NAME
         if advertisement_data.local_name:
-            if 'RAIL::' in advertisement_data.local_name:
-                user_id = advertisement_data.local_name.split('RAIL::')[
-                    1].strip()
-                print(f"   ✅ Found user in local_name: {user_id}")
-                return user_id
-            if 'RAIL_USER::' in advertisement_data.local_name:
-                user_id = advertisement_data.local_name.split('RAIL_USER::')[
-                    1].strip()
-                print(f"   ✅ Found user in local_name: {user_id[:8]}...")
-                return user_id
+            return _parse_rail_payload(advertisement_data.local_name)
 
     except Exception as e:
-        if DEBUG_MODE:
-            print(f"   ❌ Error extracting user_id: {e}")
+        device_log.debug("extract_failed", extra={"fields": {
+            "address": device.address, "error": str(e)}})
 
     return None
 
 
+def _trace_advertisement(device, advertisement_data, user_id, outcome):
+    """Per-device debug record - only built when DEBUG is on, then sampled"""
+    manufacturer_data = advertisement_data.manufacturer_data or {}
+    device_log.debug("advertisement", extra={"fields": {
+        "address": device.address,
+        "name": device.name,
+        "rssi": advertisement_data.rssi,
+        "manufacturer_ids": [hex(m) for m in manufacturer_data],
+        "our_phone": TARGET_MANUFACTURER_ID in manufacturer_data,
+        "service_uuids": list(advertisement_data.service_data or {}),
+        "user_id": user_id,
+        "outcome": outcome,
+    }})
+
+
+@metrics.timed("journey_start")
 def start_journey(user_id):
     """
     Call backend to start journey when user is detected.
@@ -173,7 +204,7 @@ def start_journey(user_id):
     try:
         response = requests.post(
             f"{BACKEND_URL}/journey_start",
-            params={"user_id": user_id},
+            params={"user_id": user_id, "coach_id": COACH_ID},
             timeout=5
         )
 
@@ -190,6 +221,7 @@ def start_journey(user_id):
         return False
 
 
+@metrics.timed("journey_end")
 def end_journey(user_id):
     """
     Call backend to end journey when user exits (fare is deducted).
@@ -197,7 +229,10 @@ def end_journey(user_id):
     try:
         response = requests.post(
             f"{BACKEND_URL}/journey_end",
-            params={"user_id": user_id},
+            params={
+                "user_id": user_id,
+                "settle": "async" if ASYNC_SETTLEMENT else "sync"
+            },
             timeout=5
         )
 
@@ -207,6 +242,11 @@ def end_journey(user_id):
             print(f"   Fare deducted: ₹{data.get('fare_amount', 0)}")
             print(f"   Remaining balance: ₹{data.get('remaining_balance', 0)}")
             return True
+        elif response.status_code == 202:
+            data = response.json()
+            print(f"🎫 Journey ended for user {user_id[:8]}...")
+            print(f"   Fare settlement queued: {data.get('settlement_id', '?')[:8]}")
+            return True
         else:
             print(f"⚠️  Journey end failed: {response.status_code}")
             return False
@@ -215,12 +255,118 @@ def end_journey(user_id):
         return False
 
 
+def start_journey_in_background(user_id, info):
+    """
+    journey_start for a rider already acknowledged locally.
+    Rolls the acknowledgement back if the backend refuses it.
+    """
+    if not start_journey(user_id):
+        info.journey_started = False
+
+
+@metrics.timed("sightings")
+def report_sightings(samples):
+    """
+    Send this scan's sightings to the backend fusion service (FUSION_MODE).
+    samples: {user_id: smoothed RSSI} for riders the local filter has inside.
+    """
+    if not samples:
+        return True
+
+    try:
+        response = requests.post(
+            f"{BACKEND_URL}/sightings",
+            json={
+                "reader_id": READER_ID,
+                "coach_id": COACH_ID,
+                "sightings": [
+                    {"user_id": user_id, "rssi": int(round(rssi))}
+                    for user_id, rssi in samples.items()
+                ]
+            },
+            timeout=5
+        )
+
+        if response.status_code == 200:
+            return True
+        else:
+            print(f"⚠️  Sighting report failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Error reporting sightings: {e}")
+        return False
+
+
+def write_checkpoint():
+    """
+    Save detected_users to CHECKPOINT_FILE. Returns users saved, or None on failure.
+    """
+    try:
+        return save_checkpoint(CHECKPOINT_FILE, detected_users, proximity,
+                               COACH_ID, READER_ID)
+    except OSError as e:
+        print(f"⚠️  Could not save tracker checkpoint: {e}")
+        return None
+
+
+def fetch_active_journeys(user_ids):
+    """
+    Ask the backend which of user_ids have an ACTIVE journey, in one call.
+    Returns {user_id: journey_id}, or None if the backend couldn't answer.
+    """
+    try:
+        response = requests.post(
+            f"{BACKEND_URL}/journeys/active",
+            json={"user_ids": user_ids},
+            timeout=5
+        )
+
+        if response.status_code == 200:
+            return response.json()["active"]
+        else:
+            print(f"⚠️  Active journey check failed: {response.status_code}")
+            return None
+    except Exception as e:
+        print(f"❌ Error checking active journeys: {e}")
+        return None
+
+
+def restore_tracker():
+    """
+    Reload the last checkpoint and reconcile it against the backend.
+    Riders who left while the scanner was down exit on the first scan.
+    Riders without an active journey are not restored; if they are still
+    aboard they go through normal entry and get a fresh journey_start.
+    Returns (users in the checkpoint, users restored).
+    """
+    saved = load_checkpoint(CHECKPOINT_FILE, COACH_ID)
+    if not saved:
+        return 0, 0
+
+    active = fetch_active_journeys([user["user_id"] for user in saved])
+
+    restored = 0
+    for user in saved:
+        user_id = user["user_id"]
+
+        # The backend knows best - a journey may have been ended elsewhere
+        started = user_id in active if active is not None else user["journey_started"]
+        if not started:
+            continue
+
+        detected_users[user_id] = TrackedUser(user["last_seen"], True)
+        proximity.restore(user_id, user["last_seen"], user["smoothed_rssi"])
+        restored += 1
+
+    return len(saved), restored
+
+
 def cleanup_ble():
     """
     Emergency cleanup function to stop all BLE activity.
     Called on exit to ensure no BLE scanning remains active.
     """
-    global active_scanner, shutdown_flag
+    global active_scanner, shutdown_flag, trace_writer, checkpoint_enabled
 
     print("\n🧹 Cleaning up BLE resources...")
 
@@ -235,11 +381,33 @@ def cleanup_ble():
         except Exception as e:
             print(f"   ⚠️  Error stopping scanner: {e}")
 
+    # Let in-flight journey_start calls land before ending anything
+    journey_executor.shutdown(wait=True)
+
+    if user_directory is not None:
+        user_directory.stop()
+
+    # Flush the advertisement trace so it can be replayed
+    if trace_writer is not None:
+        trace_writer.close()
+        print(
+            f"   📼 Trace saved: {trace_writer.path} ({trace_writer.scans} scans, {trace_writer.advertisements} advertisements)")
+        trace_writer = None
+
+    # Keep journeys running across a restart - the next start restores them
+    if checkpoint_enabled and not END_JOURNEYS_ON_SHUTDOWN:
+        saved = write_checkpoint()
+        if saved is not None:
+            print(
+                f"   💾 Saved {saved} tracked user(s) to {CHECKPOINT_FILE} - journeys stay active")
+        checkpoint_enabled = False
+        detected_users.clear()
+
     # End all active journeys gracefully
-    if detected_users:
+    if detected_users and END_JOURNEYS_ON_SHUTDOWN:
         print(f"   📋 Ending {len(detected_users)} active journey(s)...")
         for user_id, info in list(detected_users.items()):
-            if info.get('journey_started', False):
+            if info.journey_started:
                 try:
                     end_journey(user_id)
                 except Exception as e:
@@ -247,6 +415,13 @@ def cleanup_ble():
                         f"   ⚠️  Could not end journey for {user_id[:8]}: {e}")
         detected_users.clear()
 
+        # Nothing left to resume - don't let the next start restore these users
+        if checkpoint_enabled:
+            write_checkpoint()
+            checkpoint_enabled = False
+
+    eventlog.shutdown_logging()
+
     print("   ✅ BLE cleanup complete - Mac Bluetooth is now idle")
     print("   💡 You can verify with: system_profiler SPBluetoothDataType | grep Power\n")
 
@@ -271,140 +446,208 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
+def process_scan(devices_dict, current_time):
+    """
+    Run one scan's advertisements through extraction, tracking and exit logic.
+    Shared by the live BLE loop and the trace replay driver.
+    """
+    # Strongest RSSI per user this tick (a phone may show up under several addresses)
+    samples = {}
+
+    # Per-device traces are only built when someone asked for them
+    tracing = device_log.isEnabledFor(logging.DEBUG)
+
+    processing_started = time.perf_counter()
+    extract_seconds = 0.0
+    extract_calls = 0
+    matched = 0
+
+    # Process each detected device
+    for address, (device, advertisement_data) in devices_dict.items():
+        # Check shutdown flag
+        if shutdown_flag:
+            break
+
+        # Get RSSI from advertisement_data
+        rssi = advertisement_data.rssi
+
+        # A weak sample can't start a journey, so it is only worth decoding
+        # when it comes from a device the filter is already tracking - there it
+        # pulls the smoothed RSSI down and lets the leave threshold work
+        if rssi < LEAVE_RSSI_THRESHOLD:
+            tracked_user = device_users.get(address)
+            if tracked_user is None or not proximity.tracks(tracked_user):
+                device_users.pop(address, None)
+                if tracing:
+                    _trace_advertisement(device, advertisement_data, None, "below_threshold")
+                continue
+
+        # Try to extract user_id from advertisement (pass advertisement_data)
+        extract_started = time.perf_counter()
+        user_id = extract_user_id(device, advertisement_data)
+        extract_seconds += time.perf_counter() - extract_started
+        extract_calls += 1
+
+        # Not a registered user - no point asking the backend
+        if user_id and user_directory is not None and not user_directory.knows(user_id):
+            if tracing:
+                _trace_advertisement(device, advertisement_data, user_id, "unknown_user")
+            continue
+
+        if tracing:
+            _trace_advertisement(device, advertisement_data, user_id,
+                                 "matched" if user_id else "no_user_id")
+
+        if user_id:
+            matched += 1
+            samples[user_id] = max(rssi, samples.get(user_id, rssi))
+            device_users[address] = user_id
+
+    # Run every sample through the smoothed proximity model at once
+    entered, exited = proximity.update(current_time, samples)
+
+    # Forget rotated-away addresses once the map outgrows what is tracked
+    if len(device_users) > 2 * len(proximity) + 256:
+        for address in [a for a, u in device_users.items() if not proximity.tracks(u)]:
+            del device_users[address]
+
+    # Fusion mode: the backend merges every reader and makes the journey calls.
+    # Only riders this reader's filter has let in (enter threshold held for the
+    # dwell) and still holds in range are reported, with their smoothed RSSI.
+    if FUSION_MODE:
+        report_sightings(proximity.in_range(current_time))
+        metrics.observe_processing(time.perf_counter() - processing_started,
+                                   len(devices_dict), matched,
+                                   extract_seconds, extract_calls)
+        return
+
+    # User still in range - update last seen
+    for user_id in samples:
+        if user_id in detected_users:
+            smoothed = proximity.smoothed_rssi(user_id)
+            if smoothed is not None and smoothed >= LEAVE_RSSI_THRESHOLD:
+                detected_users[user_id].last_seen = current_time
+
+    # New user detected
+    for user_id in entered:
+        print(f"\n🚶 NEW USER DETECTED")
+        print(f"   User ID: {user_id[:8]}...")
+        print(f"   RSSI: {samples[user_id]} dBm (smoothed {proximity.smoothed_rssi(user_id):.1f})")
+        print(
+            f"   Time: {datetime.fromtimestamp(current_time).strftime('%H:%M:%S')}")
+
+        log_event("journey_entry", user_id=user_id, rssi=samples[user_id],
+                  smoothed_rssi=proximity.smoothed_rssi(user_id),
+                  coach_id=COACH_ID, reader_id=READER_ID)
+
+        info = detected_users[user_id] = TrackedUser(current_time)
+
+        # Known to the synced directory - acknowledge now, tell the backend in the background
+        if user_directory is not None and user_directory.ready:
+            if user_directory.low_balance(user_id):
+                print(f"   ⚠️  Low balance - fare may not be covered")
+            info.journey_started = True
+            journey_executor.submit(start_journey_in_background, user_id, info)
+
+        # Start journey
+        elif start_journey(user_id):
+            info.journey_started = True
+
+    # Users who have been out of range for EXIT_DELAY_SECONDS
+    for user_id in exited:
+        if shutdown_flag:
+            break
+
+        info = detected_users.pop(user_id, None)
+        if info is None:
+            continue
+
+        log_event("journey_exit", user_id=user_id,
+                  out_of_range_s=round(current_time - info.last_seen, 1),
+                  journey_started=info.journey_started,
+                  coach_id=COACH_ID, reader_id=READER_ID)
+
+        if info.journey_started:
+            print(f"\n🚪 USER EXITED")
+            print(f"   User ID: {user_id[:8]}...")
+            print(
+                f"   Time: {datetime.fromtimestamp(current_time).strftime('%H:%M:%S')}")
+            print(
+                f"   Out of range for: {int(current_time - info.last_seen)}s")
+
+            # End journey (deduct fare)
+            end_journey(user_id)
+
+    metrics.observe_processing(time.perf_counter() - processing_started,
+                               len(devices_dict), matched,
+                               extract_seconds, extract_calls)
+
+
 async def scan_ble_devices():
     """
     Continuously scan for BLE devices and detect railway app users.
     """
-    global active_scanner, shutdown_flag
+    global active_scanner, shutdown_flag, last_checkpoint
 
     print(f"🔍 Starting BLE scanner...")
-    print(f"📡 RSSI threshold: {RSSI_THRESHOLD} dBm")
-    print(f"⏱️  Exit delay: {EXIT_DELAY_SECONDS} seconds")
+    print(
+        f"📡 RSSI enter/leave: {ENTER_RSSI_THRESHOLD}/{LEAVE_RSSI_THRESHOLD} dBm (smoothing α={RSSI_SMOOTHING_ALPHA})")
+    print(f"⏱️  Enter dwell: {ENTER_DWELL_SECONDS}s, exit delay: {EXIT_DELAY_SECONDS}s")
     print(f"🌐 Backend: {BACKEND_URL}")
+    print(f"🚃 Coach: {COACH_ID}, reader: {READER_ID}" +
+          (" (fusion mode)" if FUSION_MODE else ""))
     print(f"{'='*60}\n")
     print("📡 Scanning for BLE devices...\n")
 
     scan_count = 0
 
+    # Measures how long the event loop is blocked between scans
+    heartbeat = asyncio.create_task(metrics.heartbeat())
+
     while not shutdown_flag:
+        cycle_started = time.perf_counter()
         try:
             # Create scanner instance
             active_scanner = BleakScanner()
 
             # Scan for BLE devices with timeout - returns dict of address -> (device, advertisement_data)
-            devices_dict = await active_scanner.discover(timeout=SCAN_INTERVAL, return_adv=True)
+            # When recording, every raw advertisement is saved as bleak reports it
+            scan_options = {}
+            if trace_writer is not None:
+                scan_options["detection_callback"] = trace_writer.detection_callback
+            devices_dict = await active_scanner.discover(
+                timeout=SCAN_INTERVAL, return_adv=True, **scan_options)
 
             # Clear scanner reference after scan completes
             active_scanner = None
 
             current_time = time.time()
-            detected_now = set()
 
-            # Debug: show total devices detected
-            if DEBUG_MODE and devices_dict:
-                print(f"\n🔍 Scan found {len(devices_dict)} BLE device(s)")
+            # Mark where this scan window was handed to process_scan
+            if trace_writer is not None:
+                trace_writer.end_scan(current_time)
 
-            # Process each detected device
-            for address, (device, advertisement_data) in devices_dict.items():
-                # Check shutdown flag
-                if shutdown_flag:
-                    break
+            process_scan(devices_dict, current_time)
 
-                # Get RSSI from advertisement_data
-                rssi = advertisement_data.rssi
-
-                # Debug: show ALL devices with their RSSI (even if below threshold)
-                if DEBUG_MODE:
-                    status = "✅" if rssi >= RSSI_THRESHOLD else "⚠️"
-                    print(
-                        f"   {status} Device: {device.name or device.address} | RSSI: {rssi} dBm")
-
-                    # Show what data types are available
-                    data_types = []
-                    if advertisement_data.service_data:
-                        data_types.append(
-                            f"service_data({len(advertisement_data.service_data)})")
-                    if advertisement_data.manufacturer_data:
-                        data_types.append(
-                            f"manufacturer_data({len(advertisement_data.manufacturer_data)})")
-
-                    if data_types:
-                        print(f"      Data: {', '.join(data_types)}")
-                    else:
-                        print(f"      No service_data or manufacturer_data")
-
-                # Check RSSI threshold (signal strength)
-                if rssi < RSSI_THRESHOLD:
-                    continue
-
-                # Try to extract user_id from advertisement (pass advertisement_data)
-                user_id = extract_user_id(device, advertisement_data)
-
-                if user_id:
-                    detected_now.add(user_id)
-
-                    # New user detected
-                    if user_id not in detected_users:
-                        print(f"\n🚶 NEW USER DETECTED")
-                        print(f"   User ID: {user_id[:8]}...")
-                        print(f"   Device: {device.name or 'Unknown'}")
-                        print(f"   RSSI: {rssi} dBm")
-                        print(
-                            f"   Time: {datetime.now().strftime('%H:%M:%S')}")
-
-                        detected_users[user_id] = {
-                            'last_seen': current_time,
-                            'journey_started': False
-                        }
-
-                        # Start journey
-                        if start_journey(user_id):
-                            detected_users[user_id]['journey_started'] = True
-
-                    # User still in range - update last seen
-                    else:
-                        detected_users[user_id]['last_seen'] = current_time
-                        # Optionally print periodic updates
-                        # print(f"👤 User {user_id[:8]}... still in range (RSSI: {rssi} dBm)")
-
-            # Check for users who have exited (not detected recently)
-            users_to_remove = []
-
-            for user_id, info in detected_users.items():
-                if shutdown_flag:
-                    break
-
-                time_since_last_seen = current_time - info['last_seen']
-
-                # User has been gone for EXIT_DELAY_SECONDS
-                if time_since_last_seen > EXIT_DELAY_SECONDS:
-                    if info['journey_started']:
-                        print(f"\n🚪 USER EXITED")
-                        print(f"   User ID: {user_id[:8]}...")
-                        print(
-                            f"   Time: {datetime.now().strftime('%H:%M:%S')}")
-                        print(
-                            f"   Out of range for: {int(time_since_last_seen)}s")
-
-                        # End journey (deduct fare)
-                        end_journey(user_id)
-
-                    users_to_remove.append(user_id)
-
-            # Remove exited users from tracking
-            for user_id in users_to_remove:
-                del detected_users[user_id]
+            # Periodic checkpoint so even a crash only loses a few seconds
+            if checkpoint_enabled and current_time - last_checkpoint >= CHECKPOINT_INTERVAL:
+                write_checkpoint()
+                last_checkpoint = current_time
 
             # Show currently tracked users or heartbeat
             scan_count += 1
             if detected_users and not shutdown_flag:
                 print(
-                    f"📊 Currently tracking {len(detected_users)} user(s)", end='\r')
+                    f"📊 Currently tracking {len(detected_users)} user(s) | "
+                    f"{proximity.suppressed_calls} backend call(s) suppressed", end='\r')
             elif scan_count % 10 == 0:  # Every 10 scans (~20 seconds)
                 print(
                     f"💚 Scanner active - waiting for devices... ({scan_count} scans)", end='\r')
 
+            metrics.observe_cycle(time.perf_counter() - cycle_started)
+
         except Exception as e:
+            metrics.observe_scan_error()
             if not shutdown_flag:
                 print(f"❌ Scan error: {e}")
             await asyncio.sleep(1)
@@ -413,6 +656,8 @@ async def scan_ble_devices():
         if not shutdown_flag:
             await asyncio.sleep(0.5)
 
+    heartbeat.cancel()
+
 
 def test_backend_connection():
     """
@@ -437,12 +682,22 @@ def main():
     """
     Main entry point - test connection and start scanner.
     """
-    global shutdown_flag
+    global shutdown_flag, trace_writer, user_directory, checkpoint_enabled
+
+    parser = argparse.ArgumentParser(description="Railway POC BLE scanner")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record every advertisement to a trace file for replay.py")
+    args = parser.parse_args()
 
     print("\n" + "="*60)
     print("🚂 RAILWAY POC - RASPBERRY PI BLE SCANNER")
     print("="*60 + "\n")
 
+    # Structured log runs on its own thread; USR1/USR2 adjust detail live
+    eventlog.setup_logging(LOG_LEVEL, LOG_FILE, DEVICE_TRACE_SAMPLE_RATE)
+    eventlog.install_signal_handlers()
+    print(f"📝 Logging {LOG_LEVEL} to {LOG_FILE} (kill -USR1/-USR2 {os.getpid()} for more/less)")
+
     # Register signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)   # Ctrl+C
     signal.signal(signal.SIGTERM, signal_handler)  # kill command
@@ -459,6 +714,32 @@ def main():
         print("\n⚠️  Please start the backend server first and update BACKEND_URL")
         return
 
+    # Pull the registered-user directory so unknown IDs can be dropped locally
+    user_directory = UserDirectory(BACKEND_URL, DIRECTORY_SYNC_INTERVAL)
+    user_directory.start()
+    if user_directory.ready:
+        print(f"📒 User directory synced: {len(user_directory)} registered user(s)")
+    else:
+        print("⚠️  User directory sync failed - every ID will be checked with the backend")
+
+    # Pick up riders tracked before the last restart
+    saved, restored = restore_tracker()
+    checkpoint_enabled = True
+    if saved:
+        print(f"💾 Restored {restored} of {saved} tracked user(s) from {CHECKPOINT_FILE} "
+              f"(the rest had no active journey)")
+
+    if METRICS_PORT:
+        try:
+            serve_metrics(metrics, METRICS_HOST, METRICS_PORT)
+            print(f"📈 Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint disabled: {e}")
+
+    if args.record:
+        trace_writer = TraceWriter(args.record)
+        print(f"📼 Recording advertisements to {args.record}")
+
     print("\n✅ Starting BLE proximity detection...\n")
 
     try:
@@ -474,6 +755,8 @@ def main():
         if not shutdown_flag:
             print("\n\n🛑 Scanner stopped")
             print(f"Final tracked users: {len(detected_users)}")
+            print(
+                f"Backend calls suppressed by RSSI smoothing: {proximity.suppressed_calls}")
             cleanup_ble()
 
 
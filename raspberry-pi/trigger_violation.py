@@ -9,13 +9,13 @@ import sys
 # Backend configuration - CHANGE THIS TO YOUR MACBOOK IP
 BACKEND_URL = "http://192.168.31.187:8000"
 
-# Note: This script is for future use when adding safety violation features
-# Currently Phase-0 POC focuses on proximity ticketing only
+# Violations are queued by the backend and fined in the background: every
+# rider with an active journey in the coach pays once per cooldown window
 
 
 def trigger_violation(coach_id="C1", door_id="D1"):
     """
-    Trigger a violation event (for future safety feature implementation).
+    Trigger a violation event for a coach door.
 
     Args:
         coach_id: Coach identifier (default: "C1")
@@ -34,11 +34,14 @@ def trigger_violation(coach_id="C1", door_id="D1"):
             timeout=5
         )
 
-        if response.status_code == 200:
+        if response.status_code == 202:
             data = response.json()
-            print(f"✅ Violation triggered successfully")
-            print(f"   Fine amount: ₹{data.get('fine', 0)}")
-            print(f"   Remaining balance: ₹{data.get('remaining_balance', 0)}")
+            print(f"✅ Violation queued")
+            print(f"   Fine per rider in coach {coach_id}: ₹{data.get('fine', 0)}")
+            print(f"   Events waiting to be written: {data.get('queued', 0)}")
+        elif response.status_code == 503:
+            retry_after = response.headers.get("Retry-After", "?")
+            print(f"⏳ Backend violation queue is full - retry in {retry_after}s")
         else:
             print(f"⚠️  Trigger failed: {response.status_code}")
             print(f"   Response: {response.text}")
@@ -47,28 +50,30 @@ def trigger_violation(coach_id="C1", door_id="D1"):
         print(f"❌ Error: {e}")
 
 
-def check_active_journeys():
+def check_violation_queue():
     """
-    Check how many active journeys exist (for debugging).
+    Show the backend violation pipeline counters (for debugging).
     """
-    print("📊 Checking active journeys...")
-    print("   (This requires backend API extension - coming in Phase-1)")
+    print("📊 Checking violation queue...")
+    try:
+        response = requests.get(f"{BACKEND_URL}/violations/status", timeout=5)
+        for key, value in response.json().items():
+            print(f"   {key}: {value}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
 
 
 if __name__ == "__main__":
     print("\n" + "="*60)
-    print("⚠️  VIOLATION TRIGGER (Phase-1 Feature)")
-    print("="*60)
-    print("\nNote: Phase-0 POC focuses on proximity-based ticketing.")
-    print("Safety violation features will be added in Phase-1.")
-    print("\nCurrently, violations are triggered automatically when")
-    print("a user exits the BLE detection range (journey_end).\n")
+    print("⚠️  VIOLATION TRIGGER")
+    print("="*60 + "\n")
 
     # Parse command line arguments
     if len(sys.argv) > 1:
         coach_id = sys.argv[1] if len(sys.argv) > 1 else "C1"
         door_id = sys.argv[2] if len(sys.argv) > 2 else "D1"
         trigger_violation(coach_id, door_id)
+        check_violation_queue()
     else:
         print("Usage: python3 trigger_violation.py [coach_id] [door_id]")
         print("Example: python3 trigger_violation.py C1 D1")
@@ -0,0 +1,103 @@
+"""
+Edge-side user directory for the Railway POC scanner
+Keeps a local copy of every registered short ID (first 8 chars of user_id)
+synced incrementally from the backend's /users/delta endpoint, so the
+scanner can drop unknown IDs without a backend round trip
+"""
+
+import threading
+import requests
+
+SHORT_ID_LENGTH = 8
+
+
+class UserDirectory:
+    """
+    Set of registered short IDs plus low-balance flags.
+
+    Until the first sync succeeds the directory is not ready and knows()
+    lets every ID through, so a backend outage at boot never blocks riders.
+    IDs registered after the last sync are unknown until the next one.
+    """
+
+    def __init__(self, backend_url, sync_interval=30):
+        self.backend_url = backend_url
+        self.sync_interval = sync_interval
+
+        self._short_ids = set()
+        self._low_balance = set()
+        self._cursor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.ready = False
+        self.syncs = 0
+        self.sync_errors = 0
+        self.dropped = 0
+
+    def knows(self, user_id):
+        """True if user_id belongs to a registered user (or we can't tell yet)"""
+        if not self.ready:
+            return True
+        if user_id[:SHORT_ID_LENGTH] in self._short_ids:
+            return True
+        self.dropped += 1
+        return False
+
+    def low_balance(self, user_id):
+        """True if the user's wallet can't cover a fare, as of the last sync"""
+        return user_id[:SHORT_ID_LENGTH] in self._low_balance
+
+    def sync(self):
+        """Pull changes since the last sync (or a full snapshot the first time)"""
+        params = {} if self._cursor is None else {"since": self._cursor}
+        try:
+            response = requests.get(
+                f"{self.backend_url}/users/delta",
+                params=params,
+                timeout=5
+            )
+            if response.status_code != 200:
+                self.sync_errors += 1
+                return False
+
+            data = response.json()
+        except Exception:
+            self.sync_errors += 1
+            return False
+
+        short_ids = set() if data["full"] else set(self._short_ids)
+        low_balance = set() if data["full"] else set(self._low_balance)
+        for user in data["users"]:
+            short_id = user["short_id"]
+            short_ids.add(short_id)
+            if user["low_balance"]:
+                low_balance.add(short_id)
+            else:
+                low_balance.discard(short_id)
+
+        # Swap whole sets so the scan loop never sees a half-applied delta
+        self._short_ids = short_ids
+        self._low_balance = low_balance
+        self._cursor = data["cursor"]
+        self.ready = True
+        self.syncs += 1
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.sync_interval):
+            self.sync()
+
+    def start(self):
+        """Initial sync, then keep refreshing in the background"""
+        self.sync()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="user-directory", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def __len__(self):
+        return len(self._short_ids)